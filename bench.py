@@ -0,0 +1,364 @@
+# Generator data sintetis dan benchmark jalur data & laporan sim.py
+#
+#   python bench.py buat-data --folder data_uji --pengguna 3 --baris 100000
+#   python bench.py jalankan --ukuran 1000,100000 --simpan hasil.json
+#   python bench.py jalankan --ukuran 1000,100000 --baseline hasil.json --ambang 0.15
+#
+# Backend penyimpanan mengikuti KEUANGAN_STORAGE seperti aplikasinya (csv/sqlite/parquet).
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime
+
+# Log waktu aplikasi dimatikan supaya tidak ikut terukur (kecuali diminta lewat env)
+os.environ.setdefault("KEUANGAN_LOG_WAKTU", "")
+
+import numpy as np
+import pandas as pd
+
+import sim
+
+# ---------------- Generator Data ----------------
+# Nominal per kategori mengikuti sebaran lognormal: (median Rp, sigma)
+NOMINAL_PENGELUARAN = {
+    "Bibit": (400_000, 0.6),
+    "Pupuk": (750_000, 0.7),
+    "Pestisida": (250_000, 0.6),
+    "Alat Tani": (150_000, 0.8),
+    "Tenaga Kerja": (1_200_000, 0.5),
+    "Lainnya": (100_000, 1.0),
+}
+NOMINAL_PEMASUKAN = {
+    "Penjualan Padi": (6_000_000, 0.7),
+    "Lain-lain": (500_000, 0.9),
+}
+# Peluang kategori, sumber dan metode (urutan sama dengan kamus di sim.py)
+BOBOT_KATEGORI = [0.15, 0.25, 0.15, 0.05, 0.3, 0.1]
+BOBOT_SUMBER = [0.7, 0.3]
+BOBOT_METODE = [0.5, 0.3, 0.12, 0.08]  # Tunai, Transfer, Piutang/Utang, Pelunasan
+KETERANGAN_CONTOH = ["Musim tanam", "Panen raya", "Pasar desa", "Kelompok tani", "Titip tengkulak"]
+
+PORSI_PEMASUKAN = 0.2
+PORSI_MUNDUR = 0.02  # transaksi yang dicatat belakangan dengan tanggal mundur
+UKURAN_POTONGAN = 200_000
+
+def nominal_acak(rng, kunci, tabel):
+    median = np.array([tabel[k][0] for k in kunci], dtype=float)
+    sigma = np.array([tabel[k][1] for k in kunci], dtype=float)
+    nilai = median * np.exp(rng.normal(0.0, 1.0, len(kunci)) * sigma)
+    # Dibulatkan ke Rp 500 seperti catatan petani
+    return (np.round(nilai / 500) * 500).clip(500).astype("int64")
+
+def tanggal_acak(rng, n, mulai, akhir, bagian, total_bagian):
+    # Tanggal naik dari potongan ke potongan (seperti input harian),
+    # sebagian kecil dicatat mundur hingga 60 hari
+    rentang = (akhir - mulai).days + 1
+    hari = np.sort(rng.uniform(rentang * bagian / total_bagian, rentang * (bagian + 1) / total_bagian, n))
+    mundur = rng.random(n) < PORSI_MUNDUR
+    hari[mundur] -= rng.uniform(0, 60, mundur.sum())
+    hari = hari.clip(0, rentang - 1).astype("int64")
+    return (pd.Timestamp(mulai) + pd.to_timedelta(hari, unit="D")).strftime("%Y-%m-%d %H:%M:%S")
+
+def keterangan_acak(rng, n, porsi=0.2):
+    isi = rng.choice(KETERANGAN_CONTOH, n)
+    return np.where(rng.random(n) < porsi, isi, "")
+
+def potongan_pemasukan(rng, tanggal, username):
+    n = len(tanggal)
+    sumber = rng.choice(sim.kategori_pemasukan["Sumber Pemasukan"], n, p=BOBOT_SUMBER)
+    df = pd.DataFrame({
+        "Tanggal": tanggal,
+        "Sumber": sumber,
+        "Jumlah": nominal_acak(rng, sumber, NOMINAL_PEMASUKAN),
+        "Metode": rng.choice(list(sim.AKUN_METODE_PEMASUKAN), n, p=BOBOT_METODE),
+        "Keterangan": keterangan_acak(rng, n),
+        "Username": username,
+        "ID": sim.buat_id_massal(n),
+    })
+    return df[sim.KOLOM_DATA["pemasukan"]]
+
+def potongan_pengeluaran(rng, tanggal, username):
+    n = len(tanggal)
+    kategori = rng.choice(list(sim.kategori_pengeluaran), n, p=BOBOT_KATEGORI)
+    sub_kategori = np.empty(n, dtype=object)
+    for nama, daftar_sub in sim.kategori_pengeluaran.items():
+        mask = kategori == nama
+        sub_kategori[mask] = rng.choice(daftar_sub, mask.sum())
+    df = pd.DataFrame({
+        "Tanggal": tanggal,
+        "Kategori": kategori,
+        "Sub Kategori": sub_kategori,
+        "Jumlah": nominal_acak(rng, kategori, NOMINAL_PENGELUARAN),
+        "Keterangan": keterangan_acak(rng, n),
+        "Metode": rng.choice(list(sim.AKUN_METODE_PENGELUARAN), n, p=BOBOT_METODE),
+        "Username": username,
+        "ID": sim.buat_id_massal(n),
+    })
+    return df[sim.KOLOM_DATA["pengeluaran"]]
+
+def buat_data_pengguna(username, baris, mulai, akhir, rng, password=None):
+    # Tulis `baris` transaksi (pemasukan + pengeluaran) beserta jurnalnya lewat
+    # backend penyimpanan aktif, per potongan supaya memori tetap kecil
+    storage = sim.get_storage()
+    total_bagian = max(1, -(-baris // UKURAN_POTONGAN))
+    for bagian in range(total_bagian):
+        n = min(UKURAN_POTONGAN, baris - bagian * UKURAN_POTONGAN)
+        tanggal = tanggal_acak(rng, n, mulai, akhir, bagian, total_bagian)
+        masuk = rng.random(n) < PORSI_PEMASUKAN
+        pem = potongan_pemasukan(rng, tanggal[masuk], username)
+        peng = potongan_pengeluaran(rng, tanggal[~masuk], username)
+        jurnal = pd.concat([sim.buat_jurnal_massal(pem, "pemasukan"), sim.buat_jurnal_massal(peng, "pengeluaran")])
+        # Pasangan debit-kredit tetap berdampingan karena pengurutannya stabil
+        jurnal = jurnal.sort_values("Tanggal", kind="stable")
+        storage.append_entry([("pemasukan.csv", pem), ("pengeluaran.csv", peng), ("jurnal.csv", jurnal)], username)
+    sim.bump_cache("pemasukan.csv", username)
+    sim.bump_cache("pengeluaran.csv", username)
+    sim.bump_cache("jurnal.csv", username)
+    sim.rebuild_ringkasan_bulanan(username)
+    if password:
+        sim.register_user(username, password)
+
+def buat_data(folder, pengguna, baris, mulai, akhir, seed=0, password=None):
+    # Data ditulis relatif ke folder (seperti aplikasi yang dijalankan dari folder itu)
+    os.makedirs(folder, exist_ok=True)
+    asal = os.getcwd()
+    os.chdir(folder)
+    try:
+        sim.set_storage(None)
+        rng = np.random.default_rng(seed)
+        for username in pengguna:
+            t = time.perf_counter()
+            buat_data_pengguna(username, baris, mulai, akhir, rng, password)
+            print(f"{username}: {baris} transaksi dalam {time.perf_counter() - t:.1f} detik")
+    finally:
+        sim.flush_tulisan()
+        sim.set_storage(None)
+        os.chdir(asal)
+
+# ---------------- Benchmark ----------------
+
+PENGGUNA_BENCH = "bench"
+# append_data menulis ke pengguna terpisah supaya data uji tidak berubah antar run
+PENGGUNA_TULIS = "bench_tulis"
+
+def ukur_kasus(fungsi, ulang, siapkan=None, pemanasan=1):
+    # Jalankan fungsi() `ulang` kali dan catat latensinya; siapkan() tidak ikut diukur.
+    # Memori puncak diukur pada putaran terpisah karena tracemalloc memperlambat eksekusi.
+    for _ in range(pemanasan):
+        if siapkan:
+            siapkan()
+        fungsi()
+    latensi = []
+    for _ in range(ulang):
+        if siapkan:
+            siapkan()
+        t = time.perf_counter()
+        fungsi()
+        latensi.append(time.perf_counter() - t)
+    if siapkan:
+        siapkan()
+    tracemalloc.start()
+    try:
+        fungsi()
+        _, puncak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return latensi, puncak
+
+def statistik(latensi, puncak, baris):
+    ms = np.array(latensi) * 1000
+    p50 = float(np.percentile(ms, 50))
+    return {
+        "ulang": len(ms),
+        "baris": int(baris),
+        "p50_ms": round(p50, 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "rata_ms": round(float(ms.mean()), 3),
+        "maks_ms": round(float(ms.max()), 3),
+        "baris_per_detik": round(baris / (p50 / 1000), 1) if p50 > 0 else None,
+        "memori_puncak_mb": round(puncak / 2**20, 3),
+    }
+
+def kasus_bench(username, mulai, akhir, ulang, ulang_tulis):
+    # Daftar (nama, fungsi, siapkan, jumlah baris yang diproses, ulang).
+    # Kasus laporan meniru perhitungan di tiap tab laporan() pada seluruh periode.
+    pemasukan_df = sim.load_data("pemasukan.csv", username)
+    pengeluaran_df = sim.load_data("pengeluaran.csv", username)
+    jurnal_df = sim.load_data("jurnal.csv", username)
+    n_jurnal = len(jurnal_df)
+    n_transaksi = len(pemasukan_df) + len(pengeluaran_df)
+    # Filter satu bulan terakhir dari periode data
+    bulan_akhir = pd.Timestamp(akhir)
+    bulan_mulai = bulan_akhir.replace(day=1)
+    akun_teramai = jurnal_df["Akun"].value_counts().index[0]
+
+    def jurnal_umum():
+        hasil = jurnal_df.sort_values("Tanggal", kind="stable")
+        sim.format_halaman(hasil.iloc[:sim.UKURAN_HALAMAN[0]], ["Debit", "Kredit"])
+        hasil[["Debit", "Kredit"]].sum()
+
+    def buku_besar():
+        df_akun = sim.hitung_buku_besar(jurnal_df, akun_teramai)
+        sim.format_halaman(df_akun.iloc[:sim.UKURAN_HALAMAN[0]], ["Debit", "Kredit", "Saldo", "Saldo Akumulatif"])
+
+    def ringkasan():
+        sim.hitung_ringkasan(username, pemasukan_df, pengeluaran_df, mulai, akhir)
+
+    def saldo_akun():
+        sim.ringkas_keuangan(sim.hitung_saldo_akun(jurnal_df))
+
+    def neraca():
+        sim.ringkas_keuangan(sim.saldo_kumulatif(username, bulan_akhir))
+
+    baris_tulis = {
+        "Tanggal": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "Kategori": "Pupuk", "Sub Kategori": "Urea",
+        "Jumlah": 50_000, "Keterangan": "bench", "Metode": "Tunai", "Username": PENGGUNA_TULIS,
+    }
+
+    def append_data():
+        sim.append_data(dict(baris_tulis, ID=sim.buat_id()), "pengeluaran.csv", PENGGUNA_TULIS).result()
+
+    return [
+        ("load_data.jurnal.dingin", lambda: sim.load_data("jurnal.csv", username), sim.clear_cache, n_jurnal, ulang),
+        ("load_data.pengeluaran.dingin", lambda: sim.load_data("pengeluaran.csv", username), sim.clear_cache, len(pengeluaran_df), ulang),
+        ("load_data.jurnal.cache", lambda: sim.load_data("jurnal.csv", username), None, n_jurnal, ulang),
+        ("load_data.jurnal.sebulan", lambda: sim.load_data("jurnal.csv", username, bulan_mulai, bulan_akhir), sim.clear_cache, n_jurnal, ulang),
+        ("load_data.jurnal.sebulan.cache", lambda: sim.load_data("jurnal.csv", username, bulan_mulai, bulan_akhir), None, n_jurnal, ulang),
+        ("filter_tanggal.sebulan", lambda: sim.filter_tanggal(jurnal_df, bulan_mulai, bulan_akhir), None, n_jurnal, ulang),
+        ("laporan.ringkasan", ringkasan, None, n_transaksi, ulang),
+        ("laporan.saldo_akun", saldo_akun, None, n_jurnal, ulang),
+        ("laporan.neraca", neraca, None, n_jurnal, ulang),
+        ("laporan.jurnal_umum", jurnal_umum, None, n_jurnal, ulang),
+        ("laporan.buku_besar", buku_besar, None, n_jurnal, ulang),
+        ("append_data", append_data, None, 1, ulang_tulis),
+    ]
+
+def jalankan_ukuran(folder, baris, ulang, ulang_tulis, seed):
+    # Data tiap ukuran dibuat sekali lalu dipakai ulang pada run berikutnya
+    mulai, akhir = date(2020, 1, 1), date(2024, 12, 31)
+    folder_ukuran = os.path.join(folder, f"ukuran_{baris}")
+    penanda = os.path.join(folder_ukuran, ".lengkap")
+    if not os.path.exists(penanda):
+        buat_data(folder_ukuran, [PENGGUNA_BENCH], baris, mulai, akhir, seed)
+        open(penanda, "w").close()
+    asal = os.getcwd()
+    os.chdir(folder_ukuran)
+    try:
+        sim.set_storage(None)
+        for base_filename in sim.FILE_DATA:
+            sim.get_storage().save(pd.DataFrame(columns=sim.get_columns(base_filename)), base_filename, PENGGUNA_TULIS)
+        sim.hapus_ringkasan_bulanan(PENGGUNA_TULIS)
+        hasil = {}
+        for nama, fungsi, siapkan, n, k in kasus_bench(PENGGUNA_BENCH, mulai, akhir, ulang, ulang_tulis):
+            latensi, puncak = ukur_kasus(fungsi, k, siapkan)
+            hasil[nama] = statistik(latensi, puncak, n)
+            print(baris_tabel(baris, nama, hasil[nama]), flush=True)
+        sim.flush_tulisan()
+    finally:
+        sim.set_storage(None)
+        os.chdir(asal)
+    return hasil
+
+def baris_tabel(ukuran, nama, s, banding=""):
+    return (f"{ukuran:>10} {nama:<30} {s['p50_ms']:>10.2f} {s['p95_ms']:>10.2f} {s['p99_ms']:>10.2f} "
+            f"{(s['baris_per_detik'] or 0):>14,.0f} {s['memori_puncak_mb']:>10.1f} {banding}")
+
+def bandingkan(hasil, baseline, ambang):
+    # Bandingkan p50 tiap kasus dengan baseline; hasil: jumlah kasus yang melambat
+    print("\nPerbandingan dengan baseline (p50):")
+    lambat = 0
+    for ukuran, kasus in hasil.items():
+        for nama, s in kasus.items():
+            dasar = baseline.get(ukuran, {}).get(nama)
+            if not dasar or not dasar["p50_ms"]:
+                continue
+            rasio = s["p50_ms"] / dasar["p50_ms"]
+            if rasio > 1 + ambang:
+                tanda = "LEBIH LAMBAT"
+                lambat += 1
+            elif rasio < 1 - ambang:
+                tanda = "lebih cepat"
+            else:
+                tanda = ""
+            print(f"{ukuran:>10} {nama:<30} {dasar['p50_ms']:>10.2f} -> {s['p50_ms']:>10.2f} ms  x{rasio:.2f} {tanda}")
+    return lambat
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generator data dan benchmark aplikasi keuangan")
+    sub = parser.add_subparsers(dest="perintah", required=True)
+
+    p_data = sub.add_parser("buat-data", help="Buat file transaksi sintetis per pengguna")
+    p_data.add_argument("--folder", default=".")
+    p_data.add_argument("--pengguna", default="3", help="jumlah pengguna atau daftar nama dipisah koma")
+    p_data.add_argument("--baris", type=int, default=10_000, help="transaksi per pengguna (1k - 10M)")
+    p_data.add_argument("--mulai", type=date.fromisoformat, default=date(2020, 1, 1))
+    p_data.add_argument("--akhir", type=date.fromisoformat, default=date(2024, 12, 31))
+    p_data.add_argument("--password", help="daftarkan pengguna dengan password ini")
+    p_data.add_argument("--seed", type=int, default=0)
+
+    p_bench = sub.add_parser("jalankan", help="Jalankan benchmark")
+    p_bench.add_argument("--folder", help="folder data uji (default: folder sementara)")
+    p_bench.add_argument("--ukuran", default="1000,10000,100000", help="jumlah transaksi, dipisah koma")
+    p_bench.add_argument("--ulang", type=int, default=10)
+    p_bench.add_argument("--ulang-tulis", type=int, default=200)
+    p_bench.add_argument("--seed", type=int, default=0)
+    p_bench.add_argument("--simpan", help="simpan hasil ke file JSON (bisa dipakai sebagai baseline)")
+    p_bench.add_argument("--baseline", help="file JSON hasil run sebelumnya")
+    p_bench.add_argument("--ambang", type=float, default=0.1, help="batas perubahan p50 yang dilaporkan")
+    p_bench.add_argument("--gagal-jika-lambat", action="store_true", help="keluar dengan kode 1 jika ada kasus melambat")
+
+    args = parser.parse_args(argv)
+
+    if args.perintah == "buat-data":
+        if args.pengguna.isdigit():
+            pengguna = [f"petani{i + 1}" for i in range(int(args.pengguna))]
+        else:
+            pengguna = [u.strip() for u in args.pengguna.split(",") if u.strip()]
+        buat_data(args.folder, pengguna, args.baris, args.mulai, args.akhir, args.seed, args.password)
+        return 0
+
+    # Tanpa --folder data uji dibuat di folder sementara dan dihapus setelah selesai
+    folder = args.folder or tempfile.mkdtemp(prefix="bench_keuangan_")
+    print(f"Data uji: {folder} (backend: {os.environ.get('KEUANGAN_STORAGE', 'csv')})")
+    print(f"{'ukuran':>10} {'kasus':<30} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'baris/detik':>14} {'memori MB':>10}")
+    hasil = {}
+    try:
+        for ukuran in [int(u) for u in args.ukuran.split(",")]:
+            hasil[str(ukuran)] = jalankan_ukuran(folder, ukuran, args.ulang, args.ulang_tulis, args.seed)
+    finally:
+        if not args.folder:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    if args.simpan:
+        laporan = {
+            "meta": {
+                "waktu": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "pandas": pd.__version__,
+                "numpy": np.__version__,
+                "platform": platform.platform(),
+                "storage": os.environ.get("KEUANGAN_STORAGE", "csv"),
+            },
+            "hasil": hasil,
+        }
+        with open(args.simpan, "w", encoding="utf-8") as f:
+            json.dump(laporan, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["hasil"]
+        lambat = bandingkan(hasil, baseline, args.ambang)
+        if lambat and args.gagal_jika_lambat:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,141 @@
-import streamlit as st
-from datetime import datetime
+from datetime import date, datetime, timedelta
 import os
+import sys
+import csv
+import atexit
+import functools
 import hashlib
-import pandas as pd
+import hmac
+import importlib
+import io
+import json
+import logging
+import logging.handlers
+import pickle
+import sqlite3
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import closing, contextmanager
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
 
+
+# ---------------- Instrumentasi Waktu ----------------
+# Durasi bagian yang sering lambat (baca/tulis data, tab laporan, halaman menu)
+# dicatat sebagai JSON per baris ke KEUANGAN_LOG_WAKTU (default mati; isi nama file
+# untuk menyalakan). File dirotasi setelah KEUANGAN_LOG_WAKTU_MB MB (3 cadangan).
+# Catatan satu rerun dikumpulkan di memori dan ditulis sekali di akhir rerun;
+# catatan rerun yang sedang berjalan juga ditampilkan di panel debug admin.
+
+LOG_WAKTU = os.environ.get("KEUANGAN_LOG_WAKTU", "")
+LOG_WAKTU_MB = float(os.environ.get("KEUANGAN_LOG_WAKTU_MB", "10"))
+ADMIN = {u.strip() for u in os.environ.get("KEUANGAN_ADMIN", "").split(",") if u.strip()}
+
+_log_lock = threading.Lock()
+_catatan = threading.local()  # Streamlit menjalankan tiap sesi di thread sendiri
+
+def is_admin(username):
+    return username in ADMIN
+
+def _logger_waktu():
+    # Satu handler per proses; file dibuka sekali dan dirotasi oleh logging
+    logger = logging.getLogger("keuangan.waktu")
+    with _log_lock:
+        if not logger.handlers:
+            handler = logging.handlers.RotatingFileHandler(
+                LOG_WAKTU, maxBytes=int(LOG_WAKTU_MB * 1024 * 1024), backupCount=3,
+                encoding="utf-8", delay=True,
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+    return logger
+
+def tulis_log_waktu(daftar):
+    if not LOG_WAKTU or not daftar:
+        return
+    baris = "\n".join(json.dumps(c, ensure_ascii=False, default=str) for c in daftar)
+    try:
+        _logger_waktu().info(baris)
+    except OSError:
+        pass  # Log waktu tidak boleh menggagalkan aplikasi
+
+def mulai_rerun(username=""):
+    # Awal satu rerun Streamlit: catatan lama dibuang, catatan baru dikumpulkan
+    _catatan.rerun = uuid.uuid4().hex[:8]
+    _catatan.pengguna = username
+    _catatan.daftar = []
+    _catatan.tertulis = False
+
+def selesai_rerun():
+    # Akhir rerun: semua catatan rerun ditulis ke log dalam satu kali tulis
+    if getattr(_catatan, "tertulis", True):
+        return
+    _catatan.tertulis = True
+    tulis_log_waktu(catatan_rerun())
+
+def catatan_rerun():
+    return list(getattr(_catatan, "daftar", None) or [])
+
+@contextmanager
+def ukur(nama, **info):
+    mulai = time.perf_counter()
+    try:
+        yield
+    finally:
+        catatan = {
+            "waktu": datetime.now().isoformat(timespec="milliseconds"),
+            "nama": nama,
+            "durasi_ms": round((time.perf_counter() - mulai) * 1000, 3),
+            "rerun": getattr(_catatan, "rerun", None),
+            "pengguna": getattr(_catatan, "pengguna", None),
+            **info,
+        }
+        if getattr(_catatan, "tertulis", True):
+            tulis_log_waktu([catatan])  # Di luar rerun (CLI, thread latar): langsung ditulis
+        else:
+            _catatan.daftar.append(catatan)
+
+def diukur(nama):
+    # Dekorator: catat durasi fungsi, beserta nama file jika argumen pertama berupa nama file
+    def dekorator(fungsi):
+        @functools.wraps(fungsi)
+        def pembungkus(*args, **kwargs):
+            info = {"berkas": args[0]} if args and isinstance(args[0], str) else {}
+            with ukur(nama, **info):
+                return fungsi(*args, **kwargs)
+        return pembungkus
+    return dekorator
+
+class ModulMalas:
+    # Modul berat (pandas, plotly, streamlit) baru di-import saat atributnya
+    # pertama kali dipakai, sehingga start awal dan halaman login tetap ringan
+    def __init__(self, nama):
+        self._nama = nama
+        self._modul = None
+
+    def __getattr__(self, attr):
+        if self._modul is None:
+            with ukur("import", modul=self._nama):
+                self._modul = importlib.import_module(self._nama)
+        return getattr(self._modul, attr)
+
+st = ModulMalas("streamlit")
+pd = ModulMalas("pandas")
+np = ModulMalas("numpy")
+px = ModulMalas("plotly.express")
+
 # ---------------- Helper Functions ----------------
 
 def hash_password(password):
@@ -16,70 +146,1158 @@ def get_user_file(base_filename, username):
     name, ext = os.path.splitext(base_filename)
     return f"{name}_{username}{ext}"
 
-def load_data(base_filename, username):
-    filename = get_user_file(base_filename, username)
-    if os.path.exists(filename):
+KOLOM_DATA = {
+    "pemasukan": ["Tanggal", "Sumber", "Jumlah", "Metode", "Keterangan", "Username", "ID"],
+    "pengeluaran": ["Tanggal", "Kategori", "Sub Kategori", "Jumlah", "Keterangan", "Metode", "Username", "ID"],
+    "jurnal": ["Tanggal", "Akun", "Debit", "Kredit", "Keterangan", "ID"],
+    # Tombstone transaksi yang dihapus (Tanggal = waktu penghapusan)
+    "hapus": ["Tanggal", "ID"],
+}
+FILE_DATA = [f"{jenis}.csv" for jenis in KOLOM_DATA]
+
+# Tipe kolom saat dimuat (load_data): kolom teks yang nilainya berulang jadi category,
+# jumlah rupiah jadi int64. Tanggal selalu di-parse menjadi datetime; kolom lain
+# (Keterangan, ID) tetap teks.
+SKEMA_DATA = {
+    "pemasukan": {"Sumber": "category", "Jumlah": "rupiah", "Metode": "category", "Username": "category"},
+    "pengeluaran": {
+        "Kategori": "category", "Sub Kategori": "category", "Jumlah": "rupiah",
+        "Metode": "category", "Username": "category",
+    },
+    "jurnal": {"Akun": "category", "Debit": "rupiah", "Kredit": "rupiah"},
+}
+
+def get_columns(base_filename):
+    # Kolom standar untuk tiap jenis file (pemasukan, pengeluaran, jurnal)
+    for jenis, kolom in KOLOM_DATA.items():
+        if jenis in base_filename:
+            return kolom
+    return []
+
+def read_header(filename):
+    # Baca baris header saja, tanpa memuat seluruh isi file
+    with open(filename, newline="", encoding="utf-8") as f:
+        return next(csv.reader(f), [])
+
+def as_frame(rows):
+    # Baris data boleh berupa list of dict atau DataFrame
+    return rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(rows)
+
+def dtype_baca(base_filename):
+    # dtype untuk pd.read_csv: ID selalu teks, kolom category langsung dibaca sebagai category
+    skema = SKEMA_DATA.get(get_jenis(base_filename), {})
+    return {"ID": str, **{kolom: "category" for kolom, tipe in skema.items() if tipe == "category"}}
+
+def terapkan_skema(df, base_filename):
+    # Samakan tipe kolom dengan SKEMA_DATA, dari backend mana pun datanya dimuat.
+    # Kategori diurutkan alfabetis supaya sort_values sama dengan pengurutan teks.
+    # Jumlah rupiah menjadi int64; jika ada nilai kosong atau pecahan, tetap float64.
+    for kolom, tipe in SKEMA_DATA.get(get_jenis(base_filename), {}).items():
+        if kolom not in df.columns:
+            continue
+        if tipe == "rupiah":
+            nilai = pd.to_numeric(df[kolom], errors="coerce")
+            if nilai.dtype != "int64" and nilai.notna().all() and (nilai % 1 == 0).all():
+                nilai = nilai.astype("int64")
+            df[kolom] = nilai
+        else:
+            seri = df[kolom]
+            if not isinstance(seri.dtype, pd.CategoricalDtype):
+                seri = seri.astype("category")
+            if not seri.cat.categories.is_monotonic_increasing:
+                seri = seri.cat.reorder_categories(seri.cat.categories.sort_values())
+            df[kolom] = seri
+    return df
+
+def get_jenis(base_filename):
+    # "pemasukan.csv" -> "pemasukan"
+    for jenis in KOLOM_DATA:
+        if jenis in base_filename:
+            return jenis
+    return os.path.splitext(base_filename)[0]
+
+_kunci_dipegang = threading.local()
+
+@contextmanager
+def kunci_file(path, bersama=False):
+    # Kunci eksklusif tingkat OS pada <path>.lock, berlaku antar thread dan antar
+    # proses server (flock di Linux/macOS, msvcrt.locking di Windows).
+    # bersama=True: kunci baca, boleh dipegang banyak pembaca sekaligus tetapi menunggu
+    # penulis selesai (di Windows tetap eksklusif).
+    # Thread yang sudah memegang kunci yang sama boleh masuk lagi, kecuali naik dari
+    # kunci baca ke kunci tulis.
+    dipegang = _kunci_dipegang.__dict__.setdefault("paths", {})
+    key = os.path.abspath(path)
+    if key in dipegang:
+        if dipegang[key] and not bersama:
+            raise RuntimeError(f"Kunci baca {path} tidak bisa dinaikkan menjadi kunci tulis")
+        yield
+        return
+    with open(path + ".lock", "a+") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH if bersama else fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        dipegang[key] = bersama
         try:
-            return pd.read_csv(filename)
-        except pd.errors.EmptyDataError:
-            # Jika file kosong, buat DataFrame kosong dengan kolom sesuai file yang dipakai
-            if "pemasukan" in filename:
-                return pd.DataFrame(columns=["Tanggal", "Sumber", "Jumlah", "Metode", "Keterangan", "Username"])
-            elif "pengeluaran" in filename:
-                return pd.DataFrame(columns=["Tanggal", "Kategori", "Sub Kategori", "Jumlah", "Keterangan", "Metode", "Username"])
-            elif "jurnal" in filename:
-                return pd.DataFrame(columns=["Tanggal", "Akun", "Debit", "Kredit", "Keterangan"])
+            yield
+        finally:
+            dipegang.pop(key, None)
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
             else:
-                return pd.DataFrame()
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+# ---------------- Penyimpanan (Storage Backend) ----------------
+# Semua akses data lewat load_data/save_data/append_data diteruskan ke backend aktif.
+# Backend dipilih lewat variabel lingkungan KEUANGAN_STORAGE ("csv", "sqlite" atau "parquet").
+# Backend dengan pushdown = True bisa membaca hanya rentang tanggal tertentu.
+
+class CsvStorage:
+    # Satu file CSV per jenis data per pengguna, contoh: pemasukan_user1.csv
+    pushdown = False
+
+    def __init__(self, folder="."):
+        self.folder = folder
+
+    def path(self, base_filename, username):
+        return os.path.join(self.folder, get_user_file(base_filename, username))
+
+    @staticmethod
+    def _lengkapi_kolom(df, base_filename):
+        # File lama belum punya kolom baru (misalnya ID) sampai ada baris yang ditambahkan;
+        # kolom yang kurang diisi kosong supaya hasil load selalu punya semua kolom
+        kurang = [k for k in get_columns(base_filename) if k not in df.columns]
+        return df.reindex(columns=list(df.columns) + kurang) if kurang else df
+
+    def load(self, base_filename, username):
+        filename = self.path(base_filename, username)
+        if os.path.exists(filename):
+            try:
+                return self._lengkapi_kolom(pd.read_csv(filename, dtype=dtype_baca(base_filename)), base_filename)
+            except pd.errors.EmptyDataError:
+                pass
+        # Jika file belum ada atau kosong, buat DataFrame kosong dengan kolom sesuai file
+        return pd.DataFrame(columns=get_columns(base_filename))
+
+    def iter_chunks(self, base_filename, username, ukuran):
+        # Baca bertahap, paling banyak `ukuran` baris per DataFrame
+        filename = self.path(base_filename, username)
+        if not os.path.exists(filename) or os.path.getsize(filename) == 0:
+            return
+        with pd.read_csv(filename, dtype={"ID": str}, chunksize=ukuran) as reader:
+            for chunk in reader:
+                yield self._lengkapi_kolom(chunk, base_filename)
+
+    def seperti_tersimpan(self, rows, base_filename):
+        # Baris baru dalam bentuk yang sama dengan hasil load() setelah ditulis
+        # (misalnya teks kosong menjadi NaN); dipakai untuk memperbarui cache
+        teks = as_frame(rows).reindex(columns=get_columns(base_filename)).to_csv(index=False)
+        return pd.read_csv(io.StringIO(teks), dtype=dtype_baca(base_filename))
+
+    def save(self, df, base_filename, username):
+        # Tulis ke file sementara lalu tukar, supaya pembaca tidak melihat file setengah jadi
+        filename = self.path(base_filename, username)
+        with kunci_file(filename):
+            df.to_csv(filename + ".tmp", index=False, date_format="%Y-%m-%d %H:%M:%S")
+            os.replace(filename + ".tmp", filename)
+
+    def version(self, base_filename, username):
+        # Penanda perubahan file (mtime, ukuran) untuk invalidasi cache
+        try:
+            st_file = os.stat(self.path(base_filename, username))
+        except FileNotFoundError:
+            return None
+        return (st_file.st_mtime_ns, st_file.st_size)
+
+    def append(self, rows, base_filename, username):
+        # File tidak dibaca ulang; header hanya ditulis saat file baru dibuat
+        if len(rows) == 0:
+            return
+        df = as_frame(rows)
+        filename = self.path(base_filename, username)
+        with kunci_file(filename):
+            file_baru = not os.path.exists(filename) or os.path.getsize(filename) == 0
+            if file_baru:
+                kolom = get_columns(base_filename) or list(df.columns)
+            else:
+                # Ikuti urutan kolom yang sudah ada di file
+                kolom = read_header(filename)
+                kurang = [k for k in get_columns(base_filename) if k not in kolom]
+                if kurang:
+                    # File lama belum punya kolom baru (misalnya ID): tambahkan sekali
+                    lama = pd.read_csv(filename, dtype=str, keep_default_na=False)
+                    kolom = kolom + kurang
+                    lama.reindex(columns=kolom, fill_value="").to_csv(filename + ".tmp", index=False)
+                    os.replace(filename + ".tmp", filename)
+                with open(filename, "rb") as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        with open(filename, "a", encoding="utf-8") as fa:
+                            fa.write("\n")
+            df.reindex(columns=kolom).to_csv(
+                filename, mode="a", header=file_baru, index=False, encoding="utf-8"
+            )
+
+    def append_entry(self, entri, username):
+        # entri: list of (base_filename, rows). CSV tidak punya transaksi,
+        # jadi tiap file ditulis berurutan (sekali tulis per file).
+        for base_filename, rows in entri:
+            self.append(rows, base_filename, username)
+
+    def list_users(self):
+        users = set()
+        for nama in os.listdir(self.folder):
+            name, ext = os.path.splitext(nama)
+            if ext != ".csv":
+                continue
+            for jenis in KOLOM_DATA:
+                if name.startswith(jenis + "_"):
+                    users.add(name[len(jenis) + 1:])
+        return sorted(users)
+
+
+class SqliteStorage:
+    # Semua pengguna dalam satu database SQLite. Tiap jenis data jadi satu tabel
+    # dengan kolom tambahan "pemilik" (username), diindeks pada pemilik, Tanggal dan Akun.
+    # Tabel _versi menyimpan nomor versi per (pemilik, jenis) untuk invalidasi cache.
+    pushdown = False
+
+    def __init__(self, path="keuangan.db"):
+        self.db_path = path
+        self._siap = set()
+        self._lokal = threading.local()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _table(self, conn, base_filename):
+        jenis = get_jenis(base_filename)
+        kolom = get_columns(base_filename)
+        if not kolom:
+            raise ValueError(f"Jenis data tidak dikenal: {base_filename}")
+        if jenis not in self._siap:
+            daftar = ", ".join(f'"{k}"' for k in kolom)
+            conn.execute(f'CREATE TABLE IF NOT EXISTS "{jenis}" (pemilik TEXT NOT NULL, {daftar})')
+            # Tambahkan kolom baru jika skema KOLOM_DATA bertambah
+            ada = {row[1] for row in conn.execute(f'PRAGMA table_info("{jenis}")')}
+            for k in kolom:
+                if k not in ada:
+                    conn.execute(f'ALTER TABLE "{jenis}" ADD COLUMN "{k}"')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "idx_{jenis}_tanggal" ON "{jenis}" (pemilik, "Tanggal")')
+            if "Akun" in kolom:
+                conn.execute(f'CREATE INDEX IF NOT EXISTS "idx_{jenis}_akun" ON "{jenis}" (pemilik, "Akun")')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS "_versi" '
+                '(pemilik TEXT NOT NULL, jenis TEXT NOT NULL, nomor INTEGER NOT NULL, PRIMARY KEY (pemilik, jenis))'
+            )
+            self._siap.add(jenis)
+        return jenis, kolom
+
+    def _insert(self, conn, rows, base_filename, username):
+        jenis, kolom = self._table(conn, base_filename)
+        daftar = ", ".join(f'"{k}"' for k in kolom)
+        tanda = ", ".join("?" for _ in range(len(kolom) + 1))
+        conn.executemany(
+            f'INSERT INTO "{jenis}" (pemilik, {daftar}) VALUES ({tanda})',
+            [
+                [username] + [_nilai_sql(nilai) for nilai in baris]
+                for baris in as_frame(rows).reindex(columns=kolom).itertuples(index=False, name=None)
+            ],
+        )
+        # Naikkan versi dalam transaksi yang sama dengan penulisan datanya
+        conn.execute(
+            'INSERT INTO "_versi" (pemilik, jenis, nomor) VALUES (?, ?, 1) '
+            'ON CONFLICT (pemilik, jenis) DO UPDATE SET nomor = nomor + 1',
+            (username, jenis),
+        )
+
+    def load(self, base_filename, username):
+        with closing(self._connect()) as conn:
+            with conn:
+                jenis, kolom = self._table(conn, base_filename)
+            daftar = ", ".join(f'"{k}"' for k in kolom)
+            return pd.read_sql_query(
+                f'SELECT {daftar} FROM "{jenis}" WHERE pemilik = ? ORDER BY rowid',
+                conn, params=(username,),
+            )
+
+    def iter_chunks(self, base_filename, username, ukuran):
+        with closing(self._connect()) as conn:
+            with conn:
+                jenis, kolom = self._table(conn, base_filename)
+            daftar = ", ".join(f'"{k}"' for k in kolom)
+            yield from pd.read_sql_query(
+                f'SELECT {daftar} FROM "{jenis}" WHERE pemilik = ? ORDER BY rowid',
+                conn, params=(username,), chunksize=ukuran,
+            )
+
+    def save(self, df, base_filename, username):
+        with closing(self._connect()) as conn:
+            with conn:
+                jenis, _ = self._table(conn, base_filename)
+                conn.execute(f'DELETE FROM "{jenis}" WHERE pemilik = ?', (username,))
+                self._insert(conn, df, base_filename, username)
+
+    def append(self, rows, base_filename, username):
+        self.append_entry([(base_filename, rows)], username)
+
+    def seperti_tersimpan(self, rows, base_filename):
+        return as_frame(rows).reindex(columns=get_columns(base_filename))
+
+    def _koneksi_versi(self, inode):
+        # Koneksi baca per thread untuk version(), yang dipanggil di setiap load_data.
+        # Dibuka ulang setelah fork atau bila file database diganti (inode berubah).
+        lokal = self._lokal
+        if getattr(lokal, "kunci", None) != (os.getpid(), inode):
+            if getattr(lokal, "kunci", (None, inode))[1] != inode:
+                # Database baru: tabel perlu diperiksa/dibuat lagi
+                self._siap.clear()
+            lokal.conn = sqlite3.connect(self.db_path, timeout=30)
+            lokal.kunci = (os.getpid(), inode)
+        return lokal.conn
+
+    def version(self, base_filename, username):
+        # (inode database, nomor versi pemilik+jenis): tulisan pengguna lain atau jenis
+        # data lain tidak membuat cache ini basi. Inode menandai database yang diganti.
+        try:
+            inode = os.stat(self.db_path).st_ino
+        except FileNotFoundError:
+            return None
+        try:
+            baris = self._koneksi_versi(inode).execute(
+                'SELECT nomor FROM "_versi" WHERE pemilik = ? AND jenis = ?',
+                (username, get_jenis(base_filename)),
+            ).fetchall()
+        except sqlite3.OperationalError:
+            # Database lama yang belum punya tabel _versi
+            baris = []
+        return (inode, baris[0][0] if baris else 0)
+
+    def append_entry(self, entri, username):
+        # Semua baris (transaksi + jurnal) di-commit dalam satu transaksi database
+        with closing(self._connect()) as conn:
+            with conn:
+                for base_filename, rows in entri:
+                    if len(rows) > 0:
+                        self._insert(conn, rows, base_filename, username)
+
+    def list_users(self):
+        users = set()
+        with closing(self._connect()) as conn:
+            for jenis in KOLOM_DATA:
+                ada = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (jenis,)
+                ).fetchone()
+                if ada:
+                    users.update(row[0] for row in conn.execute(f'SELECT DISTINCT pemilik FROM "{jenis}"'))
+        return sorted(users)
+
+
+class ParquetStorage:
+    # Data kolumnar (Parquet) dipartisi per bulan:
+    #   <folder>/<username>/<jenis>/<YYYY-MM>/part-<waktu>.parquet
+    # Setiap append menulis file part baru; kompaksi menggabungkan part kecil dalam satu bulan.
+    # Penulis (append, kompaksi, save) memegang kunci folder jenis data; pembaca memegang
+    # kunci baca yang sama, jadi selalu melihat kumpulan part yang utuh.
+    # Butuh paket opsional pyarrow (pip install pyarrow).
+    pushdown = True
+    TANPA_TANGGAL = "tanpa-tanggal"
+
+    def __init__(self, folder="data", maks_part=16):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise ImportError("Backend parquet membutuhkan paket pyarrow (pip install pyarrow)") from e
+        self.folder = folder
+        self.maks_part = maks_part
+
+    def _dir(self, base_filename, username):
+        return os.path.join(self.folder, username, get_jenis(base_filename))
+
+    def _partisi(self, base_filename, username):
+        folder = self._dir(base_filename, username)
+        if not os.path.isdir(folder):
+            return []
+        return sorted(
+            nama for nama in os.listdir(folder)
+            if os.path.isdir(os.path.join(folder, nama)) and not nama.startswith(".")
+        )
+
+    def _parts(self, folder_bulan):
+        return sorted(
+            os.path.join(folder_bulan, nama) for nama in os.listdir(folder_bulan)
+            if nama.startswith("part-") and nama.endswith(".parquet")
+        )
+
+    def _bulan(self, tanggal):
+        bulan = parse_tanggal(tanggal).dt.strftime("%Y-%m")
+        return bulan.fillna(self.TANPA_TANGGAL)
+
+    def _tandai(self, base_filename, username):
+        # File penanda versi, disentuh setiap kali data berubah
+        folder = self._dir(base_filename, username)
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, ".versi"), "w") as f:
+            f.write(str(time.time_ns()))
+
+    def _tulis_part(self, df, folder_bulan, nama=None):
+        os.makedirs(folder_bulan, exist_ok=True)
+        if nama is None:
+            nama = os.path.join(folder_bulan, f"part-{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.parquet")
+        tmp = nama + ".tmp"
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, nama)
+        return nama
+
+    def _tulis_bulanan(self, df, folder):
+        # Tanggal selalu disimpan sebagai teks, sama seperti di CSV
+        if pd.api.types.is_datetime64_any_dtype(df["Tanggal"]):
+            df = df.assign(Tanggal=df["Tanggal"].dt.strftime("%Y-%m-%d %H:%M:%S"))
+        for bulan, grup in df.groupby(self._bulan(df["Tanggal"]), sort=True):
+            self._tulis_part(grup, os.path.join(folder, bulan))
+
+    def range_key(self, mulai, akhir):
+        # Kunci cache untuk rentang partisi yang dibaca
+        return (
+            pd.Timestamp(mulai).strftime("%Y-%m") if mulai is not None else None,
+            pd.Timestamp(akhir).strftime("%Y-%m") if akhir is not None else None,
+        )
+
+    def _bulan_rentang(self, base_filename, username, mulai=None, akhir=None):
+        # Partisi bulan yang beririsan dengan [mulai, akhir]
+        bulan_mulai, bulan_akhir = self.range_key(mulai, akhir)
+        hasil = []
+        for bulan in self._partisi(base_filename, username):
+            if mulai is not None or akhir is not None:
+                if bulan == self.TANPA_TANGGAL:
+                    continue
+                if bulan_mulai is not None and bulan < bulan_mulai:
+                    continue
+                if bulan_akhir is not None and bulan > bulan_akhir:
+                    continue
+            hasil.append(bulan)
+        return hasil
+
+    def _parts_rentang(self, base_filename, username, mulai=None, akhir=None):
+        # File part dari partisi bulan yang beririsan dengan [mulai, akhir]
+        folder = self._dir(base_filename, username)
+        for bulan in self._bulan_rentang(base_filename, username, mulai, akhir):
+            yield from self._parts(os.path.join(folder, bulan))
+
+    def _kunci_baca(self, base_filename, username):
+        # Kunci baca folder jenis data; None jika pengguna belum punya data sama sekali
+        if not os.path.isdir(os.path.join(self.folder, username)):
+            return None
+        return kunci_file(self._dir(base_filename, username), bersama=True)
+
+    def load(self, base_filename, username, mulai=None, akhir=None):
+        # Hanya partisi bulan yang beririsan dengan [mulai, akhir] yang dibaca
+        kolom = get_columns(base_filename)
+        frames = []
+        kunci = self._kunci_baca(base_filename, username)
+        if kunci is not None:
+            with kunci:
+                frames = [pd.read_parquet(part) for part in self._parts_rentang(base_filename, username, mulai, akhir)]
+        if not frames:
+            return pd.DataFrame(columns=kolom)
+        df = pd.concat(frames, ignore_index=True)
+        return df.reindex(columns=kolom) if kolom else df
+
+    def iter_chunks(self, base_filename, username, ukuran, mulai=None, akhir=None):
+        # Dibaca per partisi bulan: part satu bulan dibaca utuh selama kunci baca
+        # dipegang, lalu dipecah per `ukuran` baris tanpa kunci, supaya penulis tidak
+        # menunggu sampai ekspor selesai. Memori paling banyak satu bulan data.
+        import pyarrow.parquet as pq
+        kolom = get_columns(base_filename)
+        folder = self._dir(base_filename, username)
+        kunci = self._kunci_baca(base_filename, username)
+        if kunci is None:
+            return
+        with kunci:
+            daftar_bulan = self._bulan_rentang(base_filename, username, mulai, akhir)
+        for bulan in daftar_bulan:
+            folder_bulan = os.path.join(folder, bulan)
+            with kunci_file(folder, bersama=True):
+                # Partisi bisa hilang bila data ditulis ulang (save) sejak daftar dibuat
+                tabel = [pq.read_table(part) for part in self._parts(folder_bulan)] if os.path.isdir(folder_bulan) else []
+            for bagian in tabel:
+                for batch in bagian.to_batches(max_chunksize=ukuran):
+                    df = batch.to_pandas()
+                    yield df.reindex(columns=kolom) if kolom else df
+
+    def save(self, df, base_filename, username):
+        # Tulis ulang seluruh data ke folder baru, lalu tukar dengan folder lama
+        folder = self._dir(base_filename, username)
+        baru = folder + ".baru"
+        lama = folder + ".lama"
+        os.makedirs(os.path.dirname(folder), exist_ok=True)
+        with kunci_file(folder):
+            shutil.rmtree(baru, ignore_errors=True)
+            os.makedirs(baru)
+            if not df.empty:
+                self._tulis_bulanan(df, baru)
+            if os.path.isdir(folder):
+                shutil.rmtree(lama, ignore_errors=True)
+                os.replace(folder, lama)
+            os.replace(baru, folder)
+            shutil.rmtree(lama, ignore_errors=True)
+            self._tandai(base_filename, username)
+
+    def append(self, rows, base_filename, username):
+        self.append_entry([(base_filename, rows)], username)
+
+    def seperti_tersimpan(self, rows, base_filename):
+        return as_frame(rows).reindex(columns=get_columns(base_filename))
+
+    def append_entry(self, entri, username):
+        for base_filename, rows in entri:
+            if len(rows) == 0:
+                continue
+            df = as_frame(rows)
+            df = df.reindex(columns=get_columns(base_filename) or list(df.columns))
+            folder = self._dir(base_filename, username)
+            os.makedirs(folder, exist_ok=True)
+            with kunci_file(folder):
+                self._tulis_bulanan(df, folder)
+                for bulan in self._bulan(df["Tanggal"]).unique():
+                    folder_bulan = os.path.join(folder, bulan)
+                    if len(self._parts(folder_bulan)) > self.maks_part:
+                        self._kompaksi_bulan(folder_bulan)
+                self._tandai(base_filename, username)
+
+    def _kompaksi_bulan(self, folder_bulan):
+        # Gabungkan semua part dalam satu bulan ke file part pertama (urutan entri tetap)
+        parts = self._parts(folder_bulan)
+        if len(parts) < 2:
+            return False
+        df = pd.concat([pd.read_parquet(p) for p in parts], ignore_index=True)
+        self._tulis_part(df, folder_bulan, nama=parts[0])
+        for part in parts[1:]:
+            os.remove(part)
+        return True
+
+    def compact(self, base_filename, username, min_part=2):
+        # Kompaksi semua bulan yang punya minimal min_part file part
+        folder = self._dir(base_filename, username)
+        if not os.path.isdir(folder):
+            return 0
+        jumlah = 0
+        with kunci_file(folder):
+            for bulan in self._partisi(base_filename, username):
+                folder_bulan = os.path.join(folder, bulan)
+                if len(self._parts(folder_bulan)) >= min_part and self._kompaksi_bulan(folder_bulan):
+                    jumlah += 1
+            if jumlah:
+                self._tandai(base_filename, username)
+        return jumlah
+
+    def version(self, base_filename, username):
+        try:
+            st_file = os.stat(os.path.join(self._dir(base_filename, username), ".versi"))
+        except FileNotFoundError:
+            return None
+        return (st_file.st_mtime_ns, st_file.st_size)
+
+    def list_users(self):
+        if not os.path.isdir(self.folder):
+            return []
+        return sorted(
+            nama for nama in os.listdir(self.folder)
+            if os.path.isdir(os.path.join(self.folder, nama))
+        )
+
+
+def _nilai_sql(nilai):
+    # NaN dari pandas disimpan sebagai NULL; tipe numpy diubah ke tipe Python
+    if nilai is None or nilai is pd.NaT:
+        return None
+    if isinstance(nilai, datetime):
+        return nilai.strftime("%Y-%m-%d %H:%M:%S")
+    if hasattr(nilai, "item"):
+        nilai = nilai.item()
+    if isinstance(nilai, float) and nilai != nilai:
+        return None
+    return nilai
+
+
+_storage = None
+
+def get_storage():
+    global _storage
+    if _storage is None:
+        jenis = os.environ.get("KEUANGAN_STORAGE", "csv").lower()
+        if jenis == "sqlite":
+            _storage = SqliteStorage(os.environ.get("KEUANGAN_DB", "keuangan.db"))
+        elif jenis == "parquet":
+            _storage = ParquetStorage(os.environ.get("KEUANGAN_PARQUET_DIR", "data"))
+        elif jenis == "csv":
+            _storage = CsvStorage()
+        else:
+            raise ValueError(f"KEUANGAN_STORAGE tidak dikenal: {jenis}")
+    return _storage
+
+def set_storage(storage):
+    # Ganti backend penyimpanan (misalnya untuk migrasi atau pengujian)
+    global _storage
+    _storage = storage
+    clear_cache()
+
+# ---------------- Cache Data ----------------
+# load_data menyimpan DataFrame (Tanggal sudah di-parse, baris urut Tanggal) per
+# (jenis file, username). Entri dianggap basi jika mtime/ukuran file berubah atau
+# generasi dinaikkan oleh save_data. Baris dari append_data disisipkan langsung ke
+# entri yang masih segar (sisipkan_cache). Jumlah entri dibatasi dengan kebijakan LRU.
+
+CACHE_MAKS = int(os.environ.get("KEUANGAN_CACHE_MAKS", "256"))
+_cache = OrderedDict()
+_cache_generasi = {}
+_cache_lock = threading.Lock()
+
+def parse_tanggal(series):
+    # Format tanggal di file: "YYYY-MM-DD HH:MM:SS" (data lama bisa tanpa jam)
+    return pd.to_datetime(series, format="ISO8601", errors="coerce")
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+        _cache_generasi.clear()
+
+def bump_cache(base_filename, username):
+    # Tandai data (jenis file, username) berubah sehingga load_data membaca ulang
+    key = (get_jenis(base_filename), username)
+    with _cache_lock:
+        _cache_generasi[key] = _cache_generasi.get(key, 0) + 1
+        _cache.pop(key, None)
+
+def filter_tanggal(df, mulai=None, akhir=None):
+    # Ambil baris dengan mulai <= Tanggal <= akhir (batas boleh None)
+    if df.empty or "Tanggal" not in df.columns or (mulai is None and akhir is None):
+        return df
+    mask = pd.Series(True, index=df.index)
+    if mulai is not None:
+        mask &= df["Tanggal"] >= pd.to_datetime(mulai)
+    if akhir is not None:
+        mask &= df["Tanggal"] <= pd.to_datetime(akhir)
+    return df[mask]
+
+def potong_tanggal(df, mulai=None, akhir=None):
+    # Sama dengan filter_tanggal, tetapi untuk df yang sudah urut Tanggal (NaT di akhir),
+    # seperti hasil load_data: batas rentang dicari dengan binary search dan hasilnya
+    # satu potongan baris berurutan, tanpa membandingkan setiap baris
+    if df.empty or "Tanggal" not in df.columns or (mulai is None and akhir is None):
+        return df
+    tanggal = df["Tanggal"].to_numpy()
+    awal = 0
+    if mulai is not None:
+        awal = np.searchsorted(tanggal, pd.to_datetime(mulai).to_datetime64(), side="left")
+    if akhir is not None:
+        ujung = np.searchsorted(tanggal, pd.to_datetime(akhir).to_datetime64(), side="right")
+    else:
+        # Baris tanpa tanggal (NaT) tidak termasuk rentang mana pun
+        ujung = np.searchsorted(tanggal, np.datetime64("NaT"), side="left")
+    return df.iloc[awal:max(awal, ujung)]
+
+def gabung_terurut(dasar, sisipan):
+    # Gabungkan dua DataFrame yang masing-masing sudah urut Tanggal tanpa mengurutkan
+    # ulang: posisi tiap baris sisipan dicari dengan binary search di dasar, lalu
+    # baris disusun sekali. Baris sisipan jatuh setelah baris dasar bertanggal sama.
+    if sisipan.empty:
+        return dasar
+    if dasar.empty:
+        return sisipan.reset_index(drop=True)
+    sisipan = sisipan.reindex(columns=dasar.columns)
+    selaras = {}
+    for kolom in dasar.columns:
+        a, b = dasar[kolom], sisipan[kolom]
+        if isinstance(a.dtype, pd.CategoricalDtype) and isinstance(b.dtype, pd.CategoricalDtype):
+            # Samakan daftar kategori supaya concat tetap menghasilkan category
+            if not a.cat.categories.equals(b.cat.categories):
+                kategori = a.cat.categories.union(b.cat.categories)
+                selaras[kolom] = (a.cat.set_categories(kategori), b.cat.set_categories(kategori))
+        elif a.dtype != b.dtype:
+            # Kolom yang seluruhnya kosong (dibaca sebagai float) mengikuti tipe sisi lain
+            if b.isna().all() and not pd.api.types.is_integer_dtype(a.dtype):
+                selaras[kolom] = (a, b.astype(a.dtype))
+            elif a.isna().all() and not pd.api.types.is_integer_dtype(b.dtype):
+                selaras[kolom] = (a.astype(b.dtype), b)
+    if selaras:
+        dasar = dasar.assign(**{kolom: a for kolom, (a, _) in selaras.items()})
+        sisipan = sisipan.assign(**{kolom: b for kolom, (_, b) in selaras.items()})
+    n = len(dasar)
+    posisi = np.searchsorted(dasar["Tanggal"].to_numpy(), sisipan["Tanggal"].to_numpy(), side="right")
+    urutan = np.insert(np.arange(n), posisi, np.arange(n, n + len(sisipan)))
+    return pd.concat([dasar, sisipan], ignore_index=True).take(urutan).reset_index(drop=True)
+
+def urutkan_tanggal(df):
+    # Urutkan stabil menurut Tanggal (NaT di akhir). Data ditambahkan sesuai waktu input,
+    # jadi biasanya sudah hampir urut: baris yang mengikuti tanggal maksimum sejauh ini
+    # dibiarkan di tempatnya, hanya baris bertanggal mundur yang diurutkan lalu
+    # disisipkan kembali dengan gabung_terurut
+    if "Tanggal" not in df.columns or len(df) < 2:
+        return df
+    tanggal = df["Tanggal"]
+    if tanggal.is_monotonic_increasing:
+        return df
+    urut = (tanggal >= tanggal.cummax()).to_numpy()
+    mundur = df[~urut].sort_values("Tanggal", kind="stable")
+    return gabung_terurut(df[urut].reset_index(drop=True), mundur)
+
+def _versi_cache(storage, key, base_filename, username):
+    # Penanda versi entri cache: versi penyimpanan dan generasi, ditambah versi
+    # tombstone karena hasil yang di-cache sudah tanpa baris terhapus
+    with _cache_lock:
+        generasi = _cache_generasi.get(key, 0)
+        generasi_hapus = _cache_generasi.get(("hapus", username), 0)
+    versi = (storage.version(base_filename, username), generasi)
+    if key[0] != "hapus":
+        versi += (storage.version("hapus.csv", username), generasi_hapus)
+    return versi
+
+@diukur("load_data")
+def load_data(base_filename, username, mulai=None, akhir=None):
+    # mulai/akhir opsional: hanya baris dalam rentang tanggal itu yang dikembalikan.
+    # Pada backend dengan pushdown, hanya partisi yang beririsan yang dibaca.
+    storage = get_storage()
+    key = (get_jenis(base_filename), username)
+    rentang = None
+    if storage.pushdown and (mulai is not None or akhir is not None):
+        rentang = storage.range_key(mulai, akhir)
+    versi = _versi_cache(storage, key, base_filename, username)
+    cache_key = key if rentang is None else key + (rentang,)
+    with _cache_lock:
+        entri = _cache.get(cache_key)
+        if entri is not None and entri[0] == versi:
+            _cache.move_to_end(cache_key)
+            return potong_tanggal(entri[1], mulai, akhir).copy()
+
+    with ukur("storage.load", berkas=base_filename):
+        if rentang is None:
+            df = storage.load(base_filename, username)
+        else:
+            df = storage.load(base_filename, username, mulai, akhir)
+    if "Tanggal" in df.columns:
+        with ukur("parse_tanggal", berkas=base_filename, baris=len(df)):
+            df["Tanggal"] = parse_tanggal(df["Tanggal"])
+    df = terapkan_skema(df, base_filename)
+    if key[0] != "hapus" and "ID" in df.columns and not df.empty:
+        terhapus = load_data("hapus.csv", username)["ID"]
+        if not terhapus.empty:
+            df = df[~df["ID"].isin(terhapus)].reset_index(drop=True)
+    df = urutkan_tanggal(df)
+
+    # Jika data berubah selama dibaca, hasilnya tidak di-cache: sisipkan_cache
+    # mengandalkan entri cache yang persis sama dengan versinya
+    if _versi_cache(storage, key, base_filename, username) == versi:
+        with _cache_lock:
+            _cache[cache_key] = (versi, df)
+            _cache.move_to_end(cache_key)
+            while len(_cache) > CACHE_MAKS:
+                _cache.popitem(last=False)
+    return potong_tanggal(df, mulai, akhir).copy()
+
+def sisipkan_cache(rows, base_filename, username, versi_sebelum):
+    # Setelah append: sisipkan baris baru ke DataFrame di cache (tetap urut Tanggal)
+    # alih-alih membaca ulang seluruh data. Hanya dilakukan jika entri cache sama dengan
+    # isi penyimpanan sebelum append (versi_sebelum dari _versi_cache); jika tidak, cache dibuang.
+    storage = get_storage()
+    key = (get_jenis(base_filename), username)
+    versi = _versi_cache(storage, key, base_filename, username)
+    with _cache_lock:
+        entri = _cache.get(key)
+    if entri is None or entri[0] != versi_sebelum or "Tanggal" not in entri[1].columns:
+        bump_cache(base_filename, username)
+        return
+    baru = storage.seperti_tersimpan(rows, base_filename)
+    baru["Tanggal"] = parse_tanggal(baru["Tanggal"])
+    baru = urutkan_tanggal(terapkan_skema(baru, base_filename).reset_index(drop=True))
+    df = gabung_terurut(entri[1], baru)
+    with _cache_lock:
+        if _cache.get(key) is entri:
+            _cache[key] = (versi, df)
+            return
+    bump_cache(base_filename, username)
+
+def _setelah_tulis(base_filename, username, rows=None, versi_sebelum=None):
+    # Setelah data berubah: perbarui atau buang cache, lalu perbarui ringkasan bulanan
+    # dan buang snapshot penutupan yang terkena jurnal bertanggal mundur.
+    # rows=None berarti data ditulis ulang seluruhnya; versi_sebelum adalah versi
+    # cache (_versi_cache) sebelum rows ditambahkan.
+    if rows is None or versi_sebelum is None:
+        bump_cache(base_filename, username)
     else:
-        # Jika file belum ada, buat DataFrame kosong dengan kolom sesuai file
-        if "pemasukan" in base_filename:
-            return pd.DataFrame(columns=["Tanggal", "Sumber", "Jumlah", "Metode", "Keterangan", "Username"])
-        elif "pengeluaran" in base_filename:
-            return pd.DataFrame(columns=["Tanggal", "Kategori", "Sub Kategori", "Jumlah", "Keterangan", "Metode", "Username"])
-        elif "jurnal" in base_filename:
-            return pd.DataFrame(columns=["Tanggal", "Akun", "Debit", "Kredit", "Keterangan"])
+        sisipkan_cache(rows, base_filename, username, versi_sebelum)
+    if get_jenis(base_filename) in ("pemasukan", "pengeluaran"):
+        if rows is None:
+            hapus_ringkasan_bulanan(username)
         else:
-            return pd.DataFrame()
+            perbarui_ringkasan_bulanan(rows, base_filename, username)
+    elif get_jenis(base_filename) == "jurnal":
+        if rows is None:
+            batalkan_penutupan(username)
+        elif len(rows):
+            batalkan_penutupan(username, parse_tanggal(as_frame(rows)["Tanggal"]).min())
+
+# ---------------- Antrian Tulis ----------------
+# Penulisan transaksi masuk ke antrian per pengguna dan dikerjakan oleh satu worker
+# thread di latar belakang, sehingga UI tidak menunggu file selesai ditulis.
+# Entri yang menumpuk untuk pengguna yang sama digabung jadi satu kali tulis per file.
+# Antar proses server, keamanan dijaga oleh kunci file di dalam backend penyimpanan.
+# Set KEUANGAN_ANTRIAN=0 untuk menulis langsung (misalnya dari skrip).
+
+ANTRIAN_AKTIF = os.environ.get("KEUANGAN_ANTRIAN", "1") != "0"
+
+def gabung_entri(daftar_entri):
+    # Gabungkan beberapa entri: baris untuk file yang sama disambung sesuai urutan masuk
+    gabungan = OrderedDict()
+    for entri in daftar_entri:
+        for base_filename, rows in entri:
+            if len(rows) > 0:
+                gabungan.setdefault(base_filename, []).append(as_frame(rows))
+    return [
+        (base_filename, frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True))
+        for base_filename, frames in gabungan.items()
+    ]
+
+def kunci_pengguna(username):
+    # Kunci tulis per pengguna (antar thread dan proses). Dipegang selama penulisan
+    # data, pembaruan ringkasan bulanan dan kompaksi, supaya semuanya berurutan.
+    return kunci_file(get_user_file("keuangan.csv", username))
+
+def _tulis_entri(entri, username):
+    with kunci_pengguna(username):
+        storage = get_storage()
+        # Tombstone baru mengubah isi data lain yang sudah di-cache, jadi cache
+        # hanya diperbarui di tempat untuk entri tanpa hapus.csv
+        sebelum = {}
+        if all(get_jenis(base_filename) != "hapus" for base_filename, _ in entri):
+            sebelum = {
+                base_filename: _versi_cache(storage, (get_jenis(base_filename), username), base_filename, username)
+                for base_filename, _ in entri
+            }
+        storage.append_entry(entri, username)
+        for base_filename, rows in entri:
+            _setelah_tulis(base_filename, username, rows, sebelum.get(base_filename))
+
+
+class WriteQueue:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._antrian = OrderedDict()  # username -> [(entri, Future)]
+        self._sedang = set()           # username yang sedang ditulis worker
+        self._gagal = {}               # username -> error terakhir
+        self._thread = None
+
+    def submit(self, entri, username):
+        tiket = Future()
+        with self._cond:
+            self._antrian.setdefault(username, []).append((entri, tiket))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name="keuangan-writer", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+        return tiket
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._antrian:
+                    self._cond.wait()
+                username, tugas = self._antrian.popitem(last=False)
+                self._sedang.add(username)
+            try:
+                _tulis_entri(gabung_entri([entri for entri, _ in tugas]), username)
+            except Exception as e:
+                with self._cond:
+                    self._gagal[username] = e
+                for _, tiket in tugas:
+                    tiket.set_exception(e)
+            else:
+                for _, tiket in tugas:
+                    tiket.set_result(len(tugas))
+            finally:
+                with self._cond:
+                    self._sedang.discard(username)
+                    self._cond.notify_all()
+
+    def flush(self, username=None, timeout=None):
+        # Tunggu sampai semua tulisan milik username (atau semua pengguna) selesai.
+        # Error dari worker sejak flush terakhir dilempar ulang di sini.
+        batas = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if username is None:
+                    selesai = not self._antrian and not self._sedang
+                else:
+                    selesai = username not in self._antrian and username not in self._sedang
+                if selesai:
+                    break
+                sisa = None if batas is None else batas - time.monotonic()
+                if sisa is not None and sisa <= 0:
+                    return False
+                self._cond.wait(sisa)
+            if username is None:
+                errors = list(self._gagal.values())
+                self._gagal.clear()
+            else:
+                errors = [self._gagal.pop(username)] if username in self._gagal else []
+        if errors:
+            raise errors[0]
+        return True
+
+    def tandai_dilaporkan(self, username, error):
+        # Error yang sudah ditampilkan lewat tiketnya tidak dilempar ulang oleh flush
+        with self._cond:
+            if self._gagal.get(username) is error:
+                del self._gagal[username]
 
+
+_write_queue = None
+
+def get_write_queue():
+    global _write_queue
+    if _write_queue is None:
+        _write_queue = WriteQueue()
+    return _write_queue
+
+def _reset_setelah_fork():
+    # Proses anak (fork) tidak boleh ikut mengerjakan antrian milik proses induk
+    global _write_queue
+    _write_queue = None
+    _kunci_dipegang.__dict__.clear()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_setelah_fork)
+
+def tulis_entri(entri, username):
+    # entri: list of (base_filename, rows). Hasil: Future yang selesai saat data tertulis.
+    if ANTRIAN_AKTIF:
+        return get_write_queue().submit(entri, username)
+    _tulis_entri(entri, username)
+    tiket = Future()
+    tiket.set_result(1)
+    return tiket
+
+def flush_tulisan(username=None, timeout=None):
+    # Pastikan tulisan yang masih antre sudah masuk ke penyimpanan (read-your-writes)
+    if _write_queue is None:
+        return True
+    return _write_queue.flush(username, timeout)
+
+@atexit.register
+def _flush_saat_keluar():
+    if _write_queue is not None:
+        try:
+            _write_queue.flush(timeout=30)
+        except Exception:
+            pass
+
+@diukur("save_data")
 def save_data(df, base_filename, username):
-    filename = get_user_file(base_filename, username)
-    df.to_csv(filename, index=False)
+    # Tulis ulang seluruh data; tulisan yang masih antre diselesaikan dulu
+    flush_tulisan(username)
+    with kunci_pengguna(username):
+        get_storage().save(df, base_filename, username)
+        _setelah_tulis(base_filename, username)
 
+@diukur("append_data")
 def append_data(data, base_filename, username):
-    df = load_data(base_filename, username)
-    df = pd.concat([df, pd.DataFrame([data])], ignore_index=True)
-    save_data(df, base_filename, username)
+    # Tambahkan satu baris (dict) atau beberapa baris (list of dict / DataFrame) di akhir data.
+    # Hasil: Future dari antrian tulis.
+    rows = [data] if isinstance(data, dict) else data
+    return tulis_entri([(base_filename, rows)], username)
+
+def simpan_transaksi(data, base_filename, jurnal, username):
+    # Simpan satu entri: baris transaksi dan pasangan jurnalnya dalam satu panggilan.
+    # data boleh satu dict atau banyak baris sekaligus (list of dict / DataFrame).
+    # Pada backend SQLite keduanya masuk dalam satu transaksi database.
+    # Hasil: Future dari antrian tulis.
+    rows = [data] if isinstance(data, dict) else data
+    return tulis_entri([(base_filename, rows), ("jurnal.csv", jurnal)], username)
 
-def buat_jurnal(tanggal, akun_debit, akun_kredit, jumlah, keterangan):
+def migrate_csv_to_sqlite(db_path="keuangan.db", folder="."):
+    # Pindahkan semua file CSV per pengguna ke database SQLite (sekali jalan).
+    # Data pengguna yang sudah ada di database diganti dengan isi CSV.
+    return migrate_storage(CsvStorage(folder), SqliteStorage(db_path))
+
+def migrate_csv_to_parquet(tujuan_folder="data", folder="."):
+    # Pindahkan semua file CSV per pengguna ke folder Parquet berpartisi bulanan
+    return migrate_storage(CsvStorage(folder), ParquetStorage(tujuan_folder))
+
+def migrate_storage(sumber, tujuan):
+    jumlah = {}
+    for username in sumber.list_users():
+        for base_filename in FILE_DATA:
+            df = sumber.load(base_filename, username)
+            tujuan.save(df, base_filename, username)
+            jumlah[(username, base_filename)] = len(df)
+    return jumlah
+
+def buat_jurnal(tanggal, akun_debit, akun_kredit, jumlah, keterangan, id_transaksi=None):
     return [
-        {"Tanggal": tanggal, "Akun": akun_debit, "Debit": jumlah, "Kredit": 0, "Keterangan": keterangan},
-        {"Tanggal": tanggal, "Akun": akun_kredit, "Debit": 0, "Kredit": jumlah, "Keterangan": keterangan},
+        {"Tanggal": tanggal, "Akun": akun_debit, "Debit": jumlah, "Kredit": 0, "Keterangan": keterangan, "ID": id_transaksi},
+        {"Tanggal": tanggal, "Akun": akun_kredit, "Debit": 0, "Kredit": jumlah, "Keterangan": keterangan, "ID": id_transaksi},
     ]
 
-def load_user_accounts():
-    if os.path.exists("akun.csv"):
-        return pd.read_csv("akun.csv")
+# ---------------- Akun Pengguna ----------------
+# akun.csv hanya pernah ditambah (append) di bawah kunci file. Jika satu username
+# muncul lebih dari sekali, baris terakhir yang berlaku (dipakai saat hash lama
+# di-upgrade). UserStore menyimpan indeks username -> hash di memori dan hanya
+# membaca bagian file yang bertambah sejak pembacaan terakhir.
+
+HASH_SKEMA = os.environ.get("KEUANGAN_HASH", "pbkdf2_sha256")  # "pbkdf2_sha256" atau "scrypt"
+HASH_ITERASI = int(os.environ.get("KEUANGAN_HASH_ITERASI", "310000"))
+SCRYPT_N, SCRYPT_R, SCRYPT_P = 2 ** 14, 8, 1
+
+def buat_hash(password, skema=None, iterasi=None):
+    # Hash bersalt, formatnya menyimpan skema dan parameternya, contoh:
+    # pbkdf2_sha256$310000$<salt>$<hash>  atau  scrypt$16384$8$1$<salt>$<hash>
+    skema = skema or HASH_SKEMA
+    salt = os.urandom(16)
+    if skema == "scrypt":
+        dk = hashlib.scrypt(password.encode(), salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P)
+        return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${dk.hex()}"
+    if skema == "pbkdf2_sha256":
+        iterasi = iterasi or HASH_ITERASI
+        dk = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterasi)
+        return f"pbkdf2_sha256${iterasi}${salt.hex()}${dk.hex()}"
+    raise ValueError(f"Skema hash tidak dikenal: {skema}")
+
+def cek_hash(password, tersimpan):
+    bagian = tersimpan.split("$")
+    if bagian[0] == "pbkdf2_sha256" and len(bagian) == 4:
+        dk = hashlib.pbkdf2_hmac("sha256", password.encode(), bytes.fromhex(bagian[2]), int(bagian[1]))
+    elif bagian[0] == "scrypt" and len(bagian) == 6:
+        n, r, p = (int(x) for x in bagian[1:4])
+        dk = hashlib.scrypt(password.encode(), salt=bytes.fromhex(bagian[4]), n=n, r=r, p=p)
     else:
-        return pd.DataFrame(columns=["Username", "Password"])
+        # Hash lama: SHA-256 tanpa salt (hash_password)
+        return hmac.compare_digest(hash_password(password), tersimpan)
+    return hmac.compare_digest(dk.hex(), bagian[-1])
+
+def perlu_upgrade(tersimpan):
+    # Hash lama atau skema/parameter berbeda dari konfigurasi sekarang
+    bagian = tersimpan.split("$")
+    if HASH_SKEMA == "pbkdf2_sha256":
+        return not (bagian[0] == "pbkdf2_sha256" and len(bagian) == 4 and int(bagian[1]) == HASH_ITERASI)
+    return bagian[0] != HASH_SKEMA
+
 
-def save_user_accounts(df):
-    df.to_csv("akun.csv", index=False)
+class UserStore:
+    def __init__(self, path="akun.csv"):
+        self.path = path
+        self._index = {}
+        self._versi = None
+        self._offset = 0
+        self._kolom = (0, 1)
+        self._lock = threading.Lock()
+
+    def _stat(self):
+        try:
+            st_file = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st_file.st_ino, st_file.st_mtime_ns, st_file.st_size)
+
+    def _refresh(self):
+        # Dipanggil dengan self._lock dipegang
+        versi = self._stat()
+        if versi == self._versi:
+            return
+        if versi is None:
+            self._index, self._versi, self._offset = {}, None, 0
+            return
+        # File yang sama dan hanya bertambah: baca bagian barunya saja
+        lanjut = self._versi is not None and versi[0] == self._versi[0] and versi[2] >= self._offset
+        with open(self.path, "rb") as f:
+            if lanjut:
+                f.seek(self._offset)
+            data = f.read()
+        # Abaikan baris terakhir yang belum lengkap (masih ditulis proses lain)
+        data = data[:data.rfind(b"\n") + 1]
+        rows = csv.reader(io.StringIO(data.decode("utf-8"), newline=""))
+        if lanjut:
+            index, offset = self._index, self._offset + len(data)
+        else:
+            index, offset = {}, len(data)
+            header = next(rows, [])
+            self._kolom = (
+                header.index("Username") if "Username" in header else 0,
+                header.index("Password") if "Password" in header else 1,
+            )
+        kolom_user, kolom_pw = self._kolom
+        for row in rows:
+            if len(row) > max(kolom_user, kolom_pw):
+                index[row[kolom_user]] = row[kolom_pw]
+        self._index, self._versi, self._offset = index, versi, offset
+
+    def _append(self, username, hashed):
+        # Dipanggil di dalam kunci_file(self.path)
+        file_baru = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        with open(self.path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            if file_baru:
+                writer.writerow(["Username", "Password"])
+            writer.writerow([username, hashed])
+
+    def get(self, username):
+        with self._lock:
+            self._refresh()
+            return self._index.get(username)
+
+    def usernames(self):
+        with self._lock:
+            self._refresh()
+            return sorted(self._index)
+
+    def register(self, username, password):
+        hashed = buat_hash(password)
+        with self._lock, kunci_file(self.path):
+            self._refresh()
+            if username in self._index:
+                return False  # Username sudah ada
+            self._append(username, hashed)
+            self._refresh()
+        return True
+
+    def validate(self, username, password):
+        tersimpan = self.get(username)
+        if tersimpan is None or not cek_hash(password, tersimpan):
+            return False
+        if perlu_upgrade(tersimpan):
+            # Upgrade hash lama saat login berhasil
+            hashed = buat_hash(password)
+            with self._lock, kunci_file(self.path):
+                self._refresh()
+                if self._index.get(username) == tersimpan:
+                    self._append(username, hashed)
+                    self._refresh()
+        return True
+
+
+_user_store = None
+
+def get_user_store():
+    global _user_store
+    if _user_store is None:
+        _user_store = UserStore(os.environ.get("KEUANGAN_AKUN", "akun.csv"))
+    return _user_store
+
+def load_user_accounts():
+    # Akun aktif (satu baris per username) sebagai DataFrame
+    store = get_user_store()
+    usernames = store.usernames()
+    return pd.DataFrame({"Username": usernames, "Password": [store.get(u) for u in usernames]})
 
 def register_user(username, password):
-    akun_df = load_user_accounts()
-    if (akun_df['Username'] == username).any():
-        return False  # Username sudah ada
-    akun_df = pd.concat([akun_df, pd.DataFrame([{"Username": username, "Password": hash_password(password)}])], ignore_index=True)
-    save_user_accounts(akun_df)
-    return True
+    return get_user_store().register(username, password)
 
 def validate_login(username, password):
-    akun_df = load_user_accounts()
-    hashed_pw = hash_password(password)
-    return ((akun_df['Username'] == username) & (akun_df['Password'] == hashed_pw)).any()
-
-import streamlit as st
+    return get_user_store().validate(username, password)
 
 # ---------------- Login & Register ----------------
 
@@ -137,6 +1355,1042 @@ kategori_pemasukan = {
     "Sumber Pemasukan": ["Penjualan Padi", "Lain-lain"]
 }
 
+# ---------------- Pemetaan Akun Jurnal ----------------
+
+# Pemasukan: akun debit menurut metode penerimaan, akun kredit Pendapatan
+# (kecuali pelunasan piutang yang mengurangi Piutang Dagang)
+AKUN_METODE_PEMASUKAN = {
+    "Tunai": "Kas",
+    "Transfer": "Bank",
+    "Piutang": "Piutang Dagang",
+    "Pelunasan Piutang": "Kas"
+}
+# Pengeluaran: akun kredit menurut metode pembayaran, akun debit sub kategori
+# (kecuali pelunasan utang yang mengurangi Utang Dagang)
+AKUN_METODE_PENGELUARAN = {
+    "Tunai": "Kas",
+    "Transfer": "Bank",
+    "Utang": "Utang Dagang",
+    "Pelunasan Utang": "Kas"
+}
+
+def akun_pemasukan(metode):
+    # -> (akun_debit, akun_kredit)
+    akun_kredit = "Pendapatan" if metode != "Pelunasan Piutang" else "Piutang Dagang"
+    return AKUN_METODE_PEMASUKAN[metode], akun_kredit
+
+def akun_pengeluaran(metode, sub_kategori):
+    # -> (akun_debit, akun_kredit)
+    akun_debit = sub_kategori if metode != "Pelunasan Utang" else "Utang Dagang"
+    return akun_debit, AKUN_METODE_PENGELUARAN[metode]
+
+def buat_jurnal_massal(df, jenis):
+    # Versi vektor dari akun_pemasukan/akun_pengeluaran + buat_jurnal:
+    # dua baris jurnal (debit lalu kredit) untuk setiap baris df, tanpa loop per baris
+    metode = df["Metode"]
+    if jenis == "pemasukan":
+        akun_debit = metode.map(AKUN_METODE_PEMASUKAN)
+        akun_kredit = pd.Series("Pendapatan", index=df.index).where(metode != "Pelunasan Piutang", "Piutang Dagang")
+        keterangan = df["Sumber"]
+    else:
+        akun_debit = df["Sub Kategori"].where(metode != "Pelunasan Utang", "Utang Dagang")
+        akun_kredit = metode.map(AKUN_METODE_PENGELUARAN)
+        keterangan = df["Keterangan"]
+    sisi_debit = pd.DataFrame({"Tanggal": df["Tanggal"], "Akun": akun_debit, "Debit": df["Jumlah"], "Kredit": 0, "Keterangan": keterangan, "ID": df["ID"]})
+    sisi_kredit = pd.DataFrame({"Tanggal": df["Tanggal"], "Akun": akun_kredit, "Debit": 0, "Kredit": df["Jumlah"], "Keterangan": keterangan, "ID": df["ID"]})
+    # Urutkan stabil per baris asal supaya pasangan debit-kredit tetap berdampingan
+    jurnal = pd.concat([sisi_debit, sisi_kredit]).sort_index(kind="stable").reset_index(drop=True)
+    return jurnal[KOLOM_DATA["jurnal"]]
+
+# ---------------- Bagan Akun & Mesin Agregasi ----------------
+
+# Golongan tiap akun: aset, kewajiban, pendapatan, beban.
+# Semua sub kategori pengeluaran dicatat sebagai akun beban.
+BAGAN_AKUN = {
+    "Kas": "aset",
+    "Bank": "aset",
+    "Piutang Dagang": "aset",
+    "Utang Dagang": "kewajiban",
+    "Pendapatan": "pendapatan",
+}
+for _sub_kategori in kategori_pengeluaran.values():
+    for _akun in _sub_kategori:
+        BAGAN_AKUN.setdefault(_akun, "beban")
+
+def golongan_akun(akun):
+    # Akun yang tidak terdaftar dianggap beban (sama seperti perhitungan lama)
+    return BAGAN_AKUN.get(akun, "beban")
+
+def hitung_saldo_akun(jurnal_df):
+    # Satu kali groupby: total Debit, Kredit dan Saldo (Debit - Kredit) per akun
+    if jurnal_df.empty:
+        return pd.DataFrame(
+            {"Debit": [], "Kredit": [], "Saldo": [], "Golongan": []},
+            index=pd.Index([], name="Akun"),
+        )
+    return lengkapi_saldo(jurnal_df.groupby("Akun", sort=False, observed=True)[["Debit", "Kredit"]].sum())
+
+def lengkapi_saldo(saldo):
+    # saldo: total Debit dan Kredit per akun (index Akun)
+    saldo["Saldo"] = saldo["Debit"] - saldo["Kredit"]
+    saldo["Golongan"] = [golongan_akun(akun) for akun in saldo.index]
+    return saldo
+
+def ringkas_keuangan(saldo):
+    # Angka Ringkasan, Laba Rugi dan Neraca dari hasil hitung_saldo_akun
+    per_golongan = saldo.groupby("Golongan")[["Debit", "Kredit"]].sum()
+
+    def total(golongan, kolom):
+        return per_golongan[kolom].get(golongan, 0)
+
+    def saldo_akun(akun):
+        return saldo["Saldo"].get(akun, 0)
+
+    pendapatan = total("pendapatan", "Kredit")
+    beban = total("beban", "Debit")
+    aktiva = {akun: saldo_akun(akun) for akun, gol in BAGAN_AKUN.items() if gol == "aset"}
+    # Saldo normal kewajiban di sisi kredit
+    kewajiban = {akun: -saldo_akun(akun) for akun, gol in BAGAN_AKUN.items() if gol == "kewajiban"}
+    return {
+        "pendapatan": pendapatan,
+        "beban": beban,
+        "laba_rugi": pendapatan - beban,
+        "aktiva": aktiva,
+        "total_aktiva": sum(aktiva.values()),
+        "kewajiban": kewajiban,
+        "total_kewajiban": sum(kewajiban.values()),
+        "ekuitas": pendapatan - beban,
+    }
+
+# ---------------- Ringkasan Bulanan ----------------
+# Tabel ringkasan per pengguna (ringkasan_bulanan_<user>.csv): total per
+# bulan x jenis x kategori/sumber x metode. Diperbarui setiap kali transaksi
+# disimpan, dibangun ulang dari awal hanya bila diminta atau bila file belum ada.
+
+KOLOM_RINGKASAN = ["Bulan", "Jenis", "Kategori", "Sub Kategori", "Metode", "Jumlah", "Transaksi"]
+KUNCI_RINGKASAN = ["Bulan", "Jenis", "Kategori", "Sub Kategori", "Metode"]
+# Pelunasan hanya memindahkan saldo, bukan pemasukan/pengeluaran baru
+METODE_PELUNASAN = ["Pelunasan Piutang", "Pelunasan Utang"]
+
+def file_ringkasan_bulanan(username):
+    return get_user_file("ringkasan_bulanan.csv", username)
+
+def agregat_bulanan(df, jenis):
+    # Kelompokkan baris pemasukan/pengeluaran ke format tabel ringkasan bulanan
+    if df.empty:
+        return pd.DataFrame(columns=KOLOM_RINGKASAN)
+    df = df.reindex(columns=KOLOM_DATA[jenis])
+    tanggal = df["Tanggal"]
+    if not pd.api.types.is_datetime64_any_dtype(tanggal):
+        tanggal = parse_tanggal(tanggal)
+    pemasukan = jenis == "pemasukan"
+    data = pd.DataFrame({
+        "Bulan": tanggal.dt.strftime("%Y-%m"),
+        "Jenis": "Pemasukan" if pemasukan else "Pengeluaran",
+        "Kategori": df["Sumber"] if pemasukan else df["Kategori"],
+        "Sub Kategori": "" if pemasukan else df["Sub Kategori"],
+        "Metode": df["Metode"],
+        "Jumlah": pd.to_numeric(df["Jumlah"], errors="coerce").fillna(0),
+    }).dropna(subset=["Bulan"])
+    data[KUNCI_RINGKASAN] = data[KUNCI_RINGKASAN].astype(object).fillna("").astype(str)
+    return data.groupby(KUNCI_RINGKASAN, as_index=False).agg(
+        Jumlah=("Jumlah", "sum"), Transaksi=("Jumlah", "size")
+    )
+
+def _simpan_ringkasan(ringkasan, username):
+    ringkasan = ringkasan.sort_values(KUNCI_RINGKASAN)
+    tmp = file_ringkasan_bulanan(username) + ".tmp"
+    ringkasan.to_csv(tmp, index=False, columns=KOLOM_RINGKASAN)
+    os.replace(tmp, file_ringkasan_bulanan(username))
+
+def rebuild_ringkasan_bulanan(username):
+    # Dibangun per chunk (iter_data) lalu dijumlahkan, supaya riwayat yang besar
+    # tidak dimuat utuh ke memori maupun ke cache load_data
+    with kunci_pengguna(username):
+        bagian = [
+            agregat_bulanan(chunk, get_jenis(base_filename))
+            for base_filename in ("pemasukan.csv", "pengeluaran.csv")
+            for chunk in iter_data(base_filename, username)
+        ]
+        if bagian:
+            ringkasan = pd.concat(bagian, ignore_index=True)
+            ringkasan = ringkasan.groupby(KUNCI_RINGKASAN, as_index=False)[["Jumlah", "Transaksi"]].sum()
+        else:
+            ringkasan = pd.DataFrame(columns=KOLOM_RINGKASAN)
+        _simpan_ringkasan(ringkasan, username)
+    return ringkasan
+
+def load_ringkasan_bulanan(username):
+    filename = file_ringkasan_bulanan(username)
+    if not os.path.exists(filename):
+        return rebuild_ringkasan_bulanan(username)
+    return pd.read_csv(filename, dtype={k: str for k in KUNCI_RINGKASAN}, keep_default_na=False)
+
+def perbarui_ringkasan_bulanan(rows, base_filename, username, tanda=1):
+    # Tambahkan baris baru ke ringkasan tanpa membaca ulang seluruh transaksi.
+    # tanda=-1 untuk mengurangi (transaksi dihapus).
+    filename = file_ringkasan_bulanan(username)
+    delta = agregat_bulanan(as_frame(rows), get_jenis(base_filename))
+    delta[["Jumlah", "Transaksi"]] = delta[["Jumlah", "Transaksi"]] * tanda
+    with kunci_pengguna(username):
+        if not os.path.exists(filename):
+            rebuild_ringkasan_bulanan(username)
+            return
+        ringkasan = pd.concat([load_ringkasan_bulanan(username), delta], ignore_index=True)
+        ringkasan = ringkasan.groupby(KUNCI_RINGKASAN, as_index=False)[["Jumlah", "Transaksi"]].sum()
+        _simpan_ringkasan(ringkasan[ringkasan["Transaksi"] > 0], username)
+
+def hapus_ringkasan_bulanan(username):
+    # Dipanggil saat data ditulis ulang; ringkasan dibangun ulang saat dibutuhkan
+    with kunci_pengguna(username):
+        try:
+            os.remove(file_ringkasan_bulanan(username))
+        except FileNotFoundError:
+            pass
+
+def total_bulanan(ringkasan, pemasukan_df, pengeluaran_df, mulai, akhir):
+    # Pemasukan dan pengeluaran per bulan (tanpa pelunasan) dalam rentang [mulai, akhir].
+    # Bulan yang tercakup penuh diambil dari ringkasan bulanan; hanya bulan di tepi
+    # rentang yang dihitung dari baris transaksi (pemasukan_df/pengeluaran_df sudah difilter).
+    # Batas None berarti rentang terbuka: bulan pertama/terakhir yang ada di data.
+    if mulai is None or akhir is None:
+        bulan_ada = pd.concat([ringkasan["Bulan"]] + [
+            df["Tanggal"].dt.strftime("%Y-%m") for df in (pemasukan_df, pengeluaran_df) if not df.empty
+        ]).dropna()
+        if not bulan_ada.empty:
+            if mulai is None:
+                mulai = pd.Period(bulan_ada.min(), freq="M").start_time
+            if akhir is None:
+                akhir = pd.Period(bulan_ada.max(), freq="M").end_time.normalize()
+    bulan_penuh = []
+    if mulai is not None and akhir is not None:
+        mulai, akhir = pd.Timestamp(mulai), pd.Timestamp(akhir)
+        bulan_penuh = [
+            p for p in pd.period_range(mulai, akhir, freq="M")
+            if p.start_time >= mulai and p.end_time.normalize() <= akhir
+        ]
+    bagian = []
+    if bulan_penuh:
+        label = [str(p) for p in bulan_penuh]
+        bagian.append(ringkasan[ringkasan["Bulan"].isin(label)])
+        awal, batas = bulan_penuh[0].start_time, bulan_penuh[-1].end_time
+        for df, jenis in [(pemasukan_df, "pemasukan"), (pengeluaran_df, "pengeluaran")]:
+            if not df.empty:
+                df = df[(df["Tanggal"] < awal) | (df["Tanggal"] > batas)]
+            bagian.append(agregat_bulanan(df, jenis))
+    else:
+        bagian.append(agregat_bulanan(pemasukan_df, "pemasukan"))
+        bagian.append(agregat_bulanan(pengeluaran_df, "pengeluaran"))
+    data = pd.concat(bagian, ignore_index=True)
+    data = data[~data["Metode"].isin(METODE_PELUNASAN)]
+    # Bagian kosong (DataFrame tanpa baris) membuat kolom Jumlah hasil concat bertipe object
+    data = data.assign(Jumlah=pd.to_numeric(data["Jumlah"]))
+    # fill_value=0 (bukan fillna) supaya kedua kolom tetap bertipe sama; grafik
+    # plotly menolak data lebar dengan tipe kolom berbeda
+    bulanan = data.groupby(["Bulan", "Jenis"])["Jumlah"].sum().unstack("Jenis", fill_value=0)
+    return bulanan.reindex(columns=["Pemasukan", "Pengeluaran"], fill_value=0).sort_index()
+
+# ---------------- ID Transaksi & Penghapusan ----------------
+# Setiap transaksi dan baris jurnalnya memakai ID yang sama. Menghapus transaksi
+# hanya menambah tombstone (baris ID di hapus_<user>.csv); load_data menyembunyikan
+# baris dengan ID tersebut. Baris mati dibuang secara fisik oleh kompaksi di latar
+# belakang setelah rasio tombstone melewati KEUANGAN_KOMPAKSI_RASIO.
+
+KOMPAKSI_RASIO = float(os.environ.get("KEUANGAN_KOMPAKSI_RASIO", "0.2"))
+_kompaksi_berjalan = set()
+_kompaksi_lock = threading.Lock()
+
+def buat_id():
+    return uuid.uuid4().hex[:16]
+
+def buat_id_massal(n):
+    # n ID unik sekaligus: satu prefix acak + nomor urut
+    prefix = uuid.uuid4().hex[:10]
+    return [f"{prefix}-{i}" for i in range(n)]
+
+def hapus_transaksi_id(id_transaksi, base_filename, username):
+    # Tambahkan tombstone untuk transaksi (otomatis juga baris jurnalnya).
+    # ID diperiksa di dalam kunci pengguna: dua sesi yang menghapus transaksi yang
+    # sama tidak boleh sama-sama menulis tombstone dan mengurangi ringkasan bulanan.
+    flush_tulisan(username)
+    tombstone = {"Tanggal": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "ID": id_transaksi}
+    with kunci_pengguna(username):
+        if (load_data("hapus.csv", username)["ID"] == id_transaksi).any():
+            return False
+        df = load_data(base_filename, username)
+        baris = df[df["ID"] == id_transaksi]
+        if baris.empty:
+            return False
+        _tulis_entri([("hapus.csv", [tombstone])], username)
+        perbarui_ringkasan_bulanan(baris, base_filename, username, tanda=-1)
+        batalkan_penutupan(username, baris["Tanggal"].min())
+    mulai_kompaksi(username)
+    return True
+
+def rasio_tombstone(username):
+    mati = len(load_data("hapus.csv", username))
+    hidup = len(load_data("pemasukan.csv", username)) + len(load_data("pengeluaran.csv", username))
+    return mati / (mati + hidup) if mati else 0.0
+
+def mulai_kompaksi(username, paksa=False):
+    # Jalankan kompaksi di thread latar belakang jika rasio tombstone melewati batas
+    if not paksa and rasio_tombstone(username) <= KOMPAKSI_RASIO:
+        return False
+    with _kompaksi_lock:
+        if username in _kompaksi_berjalan:
+            return False
+        _kompaksi_berjalan.add(username)
+
+    def kerja():
+        try:
+            kompaksi_hapus(username)
+        finally:
+            with _kompaksi_lock:
+                _kompaksi_berjalan.discard(username)
+
+    threading.Thread(target=kerja, name=f"kompaksi-{username}", daemon=True).start()
+    return True
+
+def kompaksi_hapus(username):
+    # Buang baris mati dari semua file, lalu kosongkan tombstone.
+    # Kunci pengguna dipegang sehingga tidak ada penulisan lain di tengah proses.
+    storage = get_storage()
+    with kunci_pengguna(username):
+        mati = storage.load("hapus.csv", username)["ID"].dropna().astype(str)
+        if mati.empty:
+            return 0
+        dibuang = 0
+        for base_filename in ("pemasukan.csv", "pengeluaran.csv", "jurnal.csv"):
+            df = storage.load(base_filename, username)
+            if "ID" not in df.columns:
+                continue
+            hidup = df[~df["ID"].isin(mati)]
+            if len(hidup) < len(df):
+                storage.save(hidup, base_filename, username)
+                bump_cache(base_filename, username)
+                dibuang += len(df) - len(hidup)
+        storage.save(pd.DataFrame(columns=KOLOM_DATA["hapus"]), "hapus.csv", username)
+        bump_cache("hapus.csv", username)
+    return dibuang
+
+def lengkapi_id(username):
+    # Beri ID pada transaksi lama (sebelum ada kolom ID) dan hubungkan dengan
+    # pasangan jurnalnya. Dulu setiap transaksi langsung diikuti dua baris jurnal;
+    # tiap pasangan jurnal dicocokkan dengan transaksi tanpa ID paling awal yang
+    # sama tanggal, pasangan akun dan jumlahnya. Transaksi tanpa pasangan jurnal
+    # (misalnya aplikasi berhenti di antara dua penulisan) tidak menghalangi yang lain.
+    # Hasil: jumlah baris (transaksi dan jurnal) yang berhasil dihubungkan.
+    flush_tulisan(username)
+    storage = get_storage()
+    with kunci_pengguna(username):
+        data = {b: storage.load(b, username).reindex(columns=get_columns(b))
+                for b in ("pemasukan.csv", "pengeluaran.csv", "jurnal.csv")}
+        for df in data.values():
+            df["ID"] = df["ID"].astype(object)
+        tanpa_id = {b: df.index[df["ID"].isna()].tolist() for b, df in data.items()}
+        if not tanpa_id["pemasukan.csv"] and not tanpa_id["pengeluaran.csv"]:
+            return 0
+
+        def akun(base_filename, row):
+            if base_filename == "pemasukan.csv":
+                return akun_pemasukan(row["Metode"])
+            return akun_pengeluaran(row["Metode"], row["Sub Kategori"])
+
+        # (tanggal, akun debit, akun kredit, jumlah) -> transaksi tanpa ID, urut file
+        antrian = {}
+        for base_filename in ("pemasukan.csv", "pengeluaran.csv"):
+            for idx in tanpa_id[base_filename]:
+                row = data[base_filename].loc[idx]
+                try:
+                    pasangan = akun(base_filename, row)
+                except KeyError:
+                    continue
+                kunci = (str(row["Tanggal"]), *pasangan, float(row["Jumlah"]))
+                antrian.setdefault(kunci, []).append((base_filename, idx))
+
+        jurnal = data["jurnal.csv"]
+        baris_jurnal = tanpa_id["jurnal.csv"]
+        jumlah = 0
+        i = 0
+        while i + 1 < len(baris_jurnal):
+            debit, kredit = jurnal.loc[baris_jurnal[i]], jurnal.loc[baris_jurnal[i + 1]]
+            sisa = None
+            if str(debit["Tanggal"]) == str(kredit["Tanggal"]) and float(debit["Debit"]) == float(kredit["Kredit"]):
+                sisa = antrian.get((str(debit["Tanggal"]), debit["Akun"], kredit["Akun"], float(debit["Debit"])))
+            if not sisa:
+                i += 1
+                continue
+            base_filename, idx = sisa.pop(0)
+            id_baru = buat_id()
+            data[base_filename].loc[idx, "ID"] = id_baru
+            jurnal.loc[[baris_jurnal[i], baris_jurnal[i + 1]], "ID"] = id_baru
+            jumlah += 3
+            i += 2
+
+        # Transaksi yang tidak menemukan pasangan jurnal tetap diberi ID sendiri
+        for base_filename in ("pemasukan.csv", "pengeluaran.csv"):
+            df = data[base_filename]
+            for idx in df.index[df["ID"].isna()]:
+                df.loc[idx, "ID"] = buat_id()
+
+        for base_filename, df in data.items():
+            storage.save(df, base_filename, username)
+            bump_cache(base_filename, username)
+    return jumlah
+
+# ---------------- Penutupan Periode ----------------
+# Saldo kumulatif (sejak transaksi pertama) per akun disimpan untuk setiap bulan
+# yang sudah ditutup, di saldo_penutupan_<username>.csv. Neraca per tanggal X =
+# snapshot bulan sebelum bulan X + baris jurnal bulan X sampai tanggal X.
+# Jurnal bertanggal mundur atau penghapusan di bulan yang sudah ditutup membuang
+# snapshot mulai bulan itu; snapshot dibangun lagi dari snapshot terakhir yang
+# masih berlaku saat dibutuhkan. Bulan berjalan tidak pernah ditutup.
+#   python sim.py tutup-buku [YYYY-MM]
+
+KOLOM_PENUTUPAN = ["Bulan", "Akun", "Debit", "Kredit"]
+
+def file_saldo_penutupan(username):
+    return get_user_file("saldo_penutupan.csv", username)
+
+def load_saldo_penutupan(username):
+    filename = file_saldo_penutupan(username)
+    if not os.path.exists(filename):
+        return pd.DataFrame(columns=KOLOM_PENUTUPAN)
+    return pd.read_csv(filename, dtype={"Bulan": str, "Akun": str})
+
+def _simpan_saldo_penutupan(snapshot, username):
+    filename = file_saldo_penutupan(username)
+    snapshot.to_csv(filename + ".tmp", index=False, columns=KOLOM_PENUTUPAN)
+    os.replace(filename + ".tmp", filename)
+
+def batalkan_penutupan(username, tanggal=None):
+    # Buang snapshot bulan `tanggal` dan sesudahnya (tanggal=None: semua snapshot).
+    # Hasil: jumlah bulan yang dibuka kembali.
+    filename = file_saldo_penutupan(username)
+    if not os.path.exists(filename) or (tanggal is not None and pd.isna(tanggal)):
+        return 0
+    with kunci_pengguna(username):
+        snapshot = load_saldo_penutupan(username)
+        if tanggal is None:
+            sisa = snapshot.iloc[0:0]
+        else:
+            sisa = snapshot[snapshot["Bulan"] < pd.Timestamp(tanggal).strftime("%Y-%m")]
+        if len(sisa) == len(snapshot):
+            return 0
+        _simpan_saldo_penutupan(sisa, username)
+        return snapshot["Bulan"].nunique() - sisa["Bulan"].nunique()
+
+def tutup_periode(username, sampai=None):
+    # Tutup setiap bulan sampai `sampai` ("YYYY-MM", default bulan lalu), mulai dari
+    # snapshot terakhir yang masih berlaku. Hasil: jumlah bulan yang baru ditutup.
+    batas = pd.Timestamp.now().to_period("M") - 1
+    if sampai is not None:
+        batas = min(batas, pd.Period(sampai, freq="M"))
+    with kunci_pengguna(username):
+        snapshot = load_saldo_penutupan(username)
+        terakhir = pd.Period(snapshot["Bulan"].max(), freq="M") if not snapshot.empty else None
+        if terakhir is not None and terakhir >= batas:
+            return 0
+        mulai = (terakhir + 1).start_time if terakhir is not None else None
+        jurnal = load_data("jurnal.csv", username, mulai, batas.end_time)
+        jurnal = jurnal[jurnal["Tanggal"].notna()]
+        if terakhir is None:
+            if jurnal.empty:
+                return 0
+            awal = jurnal["Tanggal"].min().to_period("M")
+            dasar = pd.DataFrame({"Debit": [], "Kredit": []}, index=pd.Index([], name="Akun"), dtype="int64")
+        else:
+            awal = terakhir + 1
+            dasar = snapshot[snapshot["Bulan"] == str(terakhir)].set_index("Akun")[["Debit", "Kredit"]]
+
+        mutasi = jurnal.groupby(
+            [jurnal["Tanggal"].dt.to_period("M").rename("Bulan"), jurnal["Akun"].astype(str)], observed=True
+        )[["Debit", "Kredit"]].sum()
+        daftar_akun = sorted(set(dasar.index) | set(mutasi.index.get_level_values("Akun")))
+        daftar_bulan = pd.period_range(awal, batas, freq="M")
+        # Bulan tanpa transaksi tetap punya snapshot (sama dengan bulan sebelumnya)
+        mutasi = mutasi.reindex(pd.MultiIndex.from_product([daftar_bulan, daftar_akun], names=["Bulan", "Akun"]), fill_value=0)
+        kumulatif = mutasi.groupby(level="Akun").cumsum()
+        kumulatif = kumulatif.add(dasar.reindex(daftar_akun, fill_value=0), level="Akun")
+        baru = kumulatif.reset_index()
+        baru["Bulan"] = baru["Bulan"].astype(str)
+        _simpan_saldo_penutupan(pd.concat([snapshot, baru], ignore_index=True), username)
+        return len(daftar_bulan)
+
+def saldo_kumulatif(username, tanggal):
+    # Saldo per akun dari awal sampai `tanggal` (format sama dengan hitung_saldo_akun):
+    # snapshot bulan sebelumnya + jurnal bulan berjalan
+    tanggal = pd.Timestamp(tanggal)
+    bulan_snapshot = tanggal.to_period("M") - 1
+    tutup_periode(username, bulan_snapshot)
+    with kunci_pengguna(username):
+        snapshot = load_saldo_penutupan(username)
+        snapshot = snapshot[snapshot["Bulan"] <= str(bulan_snapshot)]
+        mulai = None
+        if not snapshot.empty:
+            bulan = snapshot["Bulan"].max()
+            snapshot = snapshot[snapshot["Bulan"] == bulan].set_index("Akun")[["Debit", "Kredit"]]
+            mulai = (pd.Period(bulan, freq="M") + 1).start_time
+        ekor = load_data("jurnal.csv", username, mulai, tanggal)
+    saldo = ekor.groupby(ekor["Akun"].astype(str), sort=False)[["Debit", "Kredit"]].sum()
+    if mulai is not None:
+        saldo = snapshot.add(saldo.reindex(snapshot.index.union(saldo.index), fill_value=0), fill_value=0)
+    return lengkapi_saldo(saldo[(saldo["Debit"] != 0) | (saldo["Kredit"] != 0)].copy())
+
+# ---------------- Mesin Laporan ----------------
+# Perhitungan tiap tab laporan tanpa Streamlit: dipakai oleh laporan() dan oleh
+# laporan-batch di command line. Semua fungsi hanya menerima dan mengembalikan data.
+
+def hitung_ringkasan(username, pemasukan_df, pengeluaran_df, mulai, akhir):
+    # Total dan trend bulanan (tanpa pelunasan piutang/utang) untuk tab Ringkasan
+    bulanan = total_bulanan(load_ringkasan_bulanan(username), pemasukan_df, pengeluaran_df, mulai, akhir)
+    total_pemasukan = bulanan["Pemasukan"].sum()
+    total_pengeluaran = bulanan["Pengeluaran"].sum()
+    saldo_bersih = total_pemasukan - total_pengeluaran
+    return {
+        "bulanan": bulanan,
+        "total_pemasukan": total_pemasukan,
+        "total_pengeluaran": total_pengeluaran,
+        "saldo_bersih": saldo_bersih,
+        "persen_saldo": saldo_bersih / total_pemasukan * 100 if total_pemasukan > 0 else 0,
+    }
+
+def hitung_buku_besar(jurnal_df, akun=None):
+    # Mutasi per akun, urut tanggal, dengan saldo dan saldo akumulatif.
+    # akun=None: semua akun sekaligus (saldo akumulatif dihitung per akun).
+    df = jurnal_df if akun is None else jurnal_df[jurnal_df["Akun"] == akun]
+    df = df.sort_values("Tanggal", kind="stable")
+    if akun is None:
+        df = df.sort_values("Akun", kind="stable")
+    df = df.assign(Saldo=df["Debit"] - df["Kredit"])
+    df["Saldo Akumulatif"] = df.groupby("Akun", sort=False, observed=True)["Saldo"].cumsum()
+    return df
+
+def tabel_laba_rugi(hasil):
+    return pd.DataFrame([
+        {"Keterangan": "Pendapatan", "Jumlah": hasil["pendapatan"]},
+        {"Keterangan": "Beban", "Jumlah": hasil["beban"]},
+        {"Keterangan": "Laba (Rugi)", "Jumlah": hasil["laba_rugi"]},
+    ])
+
+def tabel_neraca(hasil):
+    # Akun aktiva dan kewajiban mengikuti BAGAN_AKUN; baris judul/pemisah berisi ""
+    total_kewajiban = hasil["total_kewajiban"]
+    ekuitas = hasil["ekuitas"]
+    neraca_data = [{"Keterangan": "AKTIVA", "Jumlah": ""}]
+    neraca_data += [{"Keterangan": f"- {akun}", "Jumlah": nilai} for akun, nilai in hasil["aktiva"].items()]
+    neraca_data += [
+        {"Keterangan": "Total Aktiva", "Jumlah": hasil["total_aktiva"]},
+        {"Keterangan": "", "Jumlah": ""},
+        {"Keterangan": "KEWAJIBAN", "Jumlah": ""},
+    ]
+    neraca_data += [{"Keterangan": f"- {akun}", "Jumlah": nilai} for akun, nilai in hasil["kewajiban"].items()]
+    neraca_data += [
+        {"Keterangan": "Total Kewajiban", "Jumlah": total_kewajiban},
+        {"Keterangan": "", "Jumlah": ""},
+        {"Keterangan": "EKUITAS", "Jumlah": ""},
+        {"Keterangan": "- Laba (Rugi) Bersih", "Jumlah": ekuitas},
+        {"Keterangan": "Total Ekuitas", "Jumlah": ekuitas},
+        {"Keterangan": "", "Jumlah": ""},
+        {"Keterangan": "TOTAL KEWAJIBAN + EKUITAS", "Jumlah": total_kewajiban + ekuitas}
+    ]
+    return pd.DataFrame(neraca_data)
+
+def neraca_seimbang(hasil, toleransi=1):
+    # Toleransi 1 rupiah
+    return abs(hasil["total_aktiva"] - (hasil["total_kewajiban"] + hasil["ekuitas"])) <= toleransi
+
+def buat_laporan(username, mulai=None, akhir=None):
+    # Semua bagian laporan untuk satu pengguna dan satu periode
+    pemasukan_df = load_data("pemasukan.csv", username, mulai, akhir)
+    pengeluaran_df = load_data("pengeluaran.csv", username, mulai, akhir)
+    jurnal_df = load_data("jurnal.csv", username, mulai, akhir)
+    hasil = ringkas_keuangan(hitung_saldo_akun(jurnal_df))
+    # Neraca memakai saldo kumulatif per tanggal akhir, bukan hanya jurnal periode ini
+    if akhir is not None:
+        hasil_neraca = ringkas_keuangan(saldo_kumulatif(username, akhir))
+    elif mulai is not None:
+        hasil_neraca = ringkas_keuangan(hitung_saldo_akun(load_data("jurnal.csv", username)))
+    else:
+        hasil_neraca = hasil
+    return {
+        "username": username,
+        "mulai": mulai,
+        "akhir": akhir,
+        "pemasukan": pemasukan_df,
+        "pengeluaran": pengeluaran_df,
+        "jurnal": jurnal_df,
+        "hasil": hasil,
+        "hasil_neraca": hasil_neraca,
+        "ringkasan": hitung_ringkasan(username, pemasukan_df, pengeluaran_df, mulai, akhir),
+        "laba_rugi": tabel_laba_rugi(hasil),
+        "neraca": tabel_neraca(hasil_neraca),
+        "buku_besar": hitung_buku_besar(jurnal_df),
+    }
+
+# ---------------- Laporan Batch ----------------
+# Laporan periode untuk semua pengguna, dihitung paralel per pengguna (satu proses
+# per pengguna) dan ditulis ke folder_output/<mulai>_<akhir>/<username>/.
+#   python sim.py laporan-batch [YYYY-MM | YYYY-MM-DD:YYYY-MM-DD] [folder_output] [jumlah_proses]
+
+def periode_laporan(teks=None, hari_ini=None):
+    # None: bulan lalu (laporan akhir bulan); "YYYY-MM": satu bulan; "mulai:akhir": rentang tanggal
+    if teks is None:
+        akhir = (hari_ini or date.today()).replace(day=1) - timedelta(days=1)
+        return akhir.replace(day=1), akhir
+    if ":" in teks:
+        mulai, akhir = teks.split(":", 1)
+        return date.fromisoformat(mulai), date.fromisoformat(akhir)
+    mulai = date.fromisoformat(teks + "-01")
+    akhir = (mulai.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    return mulai, akhir
+
+def tulis_laporan(laporan, folder):
+    # Tulis ke folder sementara lalu tukar, supaya folder laporan tidak pernah setengah jadi
+    baru = folder + ".baru"
+    shutil.rmtree(baru, ignore_errors=True)
+    os.makedirs(baru)
+    format_tanggal = "%Y-%m-%d"
+    ringkasan = laporan["ringkasan"]
+    ringkasan["bulanan"].to_csv(os.path.join(baru, "ringkasan_bulanan.csv"))
+    laporan["laba_rugi"].to_csv(os.path.join(baru, "laba_rugi.csv"), index=False)
+    laporan["neraca"].to_csv(os.path.join(baru, "neraca.csv"), index=False)
+    laporan["jurnal"].sort_values("Tanggal", kind="stable").to_csv(
+        os.path.join(baru, "jurnal_umum.csv"), index=False, date_format=format_tanggal
+    )
+    laporan["buku_besar"].to_csv(os.path.join(baru, "buku_besar.csv"), index=False, date_format=format_tanggal)
+    hasil = laporan["hasil"]
+    hasil_neraca = laporan["hasil_neraca"]
+    with open(os.path.join(baru, "ringkasan.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "username": laporan["username"],
+            "mulai": None if laporan["mulai"] is None else str(laporan["mulai"]),
+            "akhir": None if laporan["akhir"] is None else str(laporan["akhir"]),
+            "total_pemasukan": ringkasan["total_pemasukan"],
+            "total_pengeluaran": ringkasan["total_pengeluaran"],
+            "saldo_bersih": ringkasan["saldo_bersih"],
+            "pendapatan": hasil["pendapatan"],
+            "beban": hasil["beban"],
+            "laba_rugi": hasil["laba_rugi"],
+            "neraca": {
+                "aktiva": hasil_neraca["aktiva"],
+                "total_aktiva": hasil_neraca["total_aktiva"],
+                "kewajiban": hasil_neraca["kewajiban"],
+                "total_kewajiban": hasil_neraca["total_kewajiban"],
+                "ekuitas": hasil_neraca["ekuitas"],
+                "seimbang": neraca_seimbang(hasil_neraca),
+            },
+        }, f, ensure_ascii=False, indent=2, default=lambda x: x.item() if hasattr(x, "item") else str(x))
+    lama = folder + ".lama"
+    if os.path.isdir(folder):
+        shutil.rmtree(lama, ignore_errors=True)
+        os.replace(folder, lama)
+    os.replace(baru, folder)
+    shutil.rmtree(lama, ignore_errors=True)
+
+def _laporan_batch_pengguna(tugas):
+    # Dijalankan di proses pekerja; error dicatat per pengguna, tidak menghentikan batch
+    username, mulai, akhir, folder = tugas
+    awal = time.perf_counter()
+    baris = {"Username": username}
+    try:
+        laporan = buat_laporan(username, mulai, akhir)
+        tulis_laporan(laporan, folder)
+        hasil_neraca = laporan["hasil_neraca"]
+        baris.update({
+            "Transaksi": len(laporan["pemasukan"]) + len(laporan["pengeluaran"]),
+            "Pemasukan": laporan["ringkasan"]["total_pemasukan"],
+            "Pengeluaran": laporan["ringkasan"]["total_pengeluaran"],
+            "Laba (Rugi)": laporan["hasil"]["laba_rugi"],
+            "Total Aktiva": hasil_neraca["total_aktiva"],
+            "Total Kewajiban": hasil_neraca["total_kewajiban"],
+            "Seimbang": neraca_seimbang(hasil_neraca),
+            "Error": "",
+        })
+    except Exception as e:
+        baris["Error"] = f"{type(e).__name__}: {e}"
+    baris["Durasi (detik)"] = round(time.perf_counter() - awal, 3)
+    return baris
+
+def laporan_batch(mulai, akhir, folder_output="laporan", proses=None, pengguna=None):
+    # Hasil: DataFrame indeks (satu baris per pengguna), juga ditulis ke indeks.csv
+    daftar = sorted(pengguna) if pengguna is not None else get_storage().list_users()
+    flush_tulisan()
+    folder_periode = os.path.join(folder_output, f"{mulai:%Y-%m-%d}_{akhir:%Y-%m-%d}")
+    os.makedirs(folder_periode, exist_ok=True)
+    tugas = [(username, mulai, akhir, os.path.join(folder_periode, username)) for username in daftar]
+    if proses == 1 or len(tugas) <= 1:
+        baris = [_laporan_batch_pengguna(t) for t in tugas]
+    else:
+        with ProcessPoolExecutor(max_workers=proses) as executor:
+            baris = list(executor.map(_laporan_batch_pengguna, tugas))
+    indeks = pd.DataFrame(baris, columns=[
+        "Username", "Transaksi", "Pemasukan", "Pengeluaran", "Laba (Rugi)",
+        "Total Aktiva", "Total Kewajiban", "Seimbang", "Error", "Durasi (detik)",
+    ])
+    indeks.to_csv(os.path.join(folder_periode, "indeks.csv"), index=False)
+    return indeks
+
+# ---------------- Ekspor Bertahap ----------------
+# Jurnal Umum dan Buku Besar diekspor ke CSV, Excel atau PDF tanpa memuat seluruh
+# riwayat: data dibaca per chunk dari storage, diurutkan lewat file sementara per
+# bulan (dan per akun untuk buku besar), lalu ditulis baris demi baris.
+# Excel butuh paket opsional xlsxwriter, PDF butuh reportlab.
+
+UKURAN_CHUNK = int(os.environ.get("KEUANGAN_UKURAN_CHUNK", "50000"))
+FORMAT_EKSPOR = {
+    "CSV": ("csv", "text/csv"),
+    "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "PDF": ("pdf", "application/pdf"),
+}
+KOLOM_EKSPOR = {
+    "jurnal": ["Tanggal", "Akun", "Debit", "Kredit", "Keterangan", "ID"],
+    "buku_besar": ["Tanggal", "Akun", "Debit", "Kredit", "Saldo", "Saldo Akumulatif", "Keterangan", "ID"],
+}
+JUDUL_EKSPOR = {"jurnal": "Jurnal Umum", "buku_besar": "Buku Besar"}
+KOLOM_RUPIAH_EKSPOR = ["Debit", "Kredit", "Saldo", "Saldo Akumulatif"]
+MAKS_BARIS_EXCEL = 1_048_576
+
+def iter_data(base_filename, username, mulai=None, akhir=None, ukuran=None):
+    # Versi bertahap dari load_data: tiap chunk sudah dengan Tanggal ter-parse,
+    # tanpa baris terhapus, dan hanya dalam rentang [mulai, akhir]
+    storage = get_storage()
+    ukuran = ukuran or UKURAN_CHUNK
+    terhapus = None
+    if get_jenis(base_filename) != "hapus":
+        terhapus = load_data("hapus.csv", username)["ID"]
+    if storage.pushdown and (mulai is not None or akhir is not None):
+        chunks = storage.iter_chunks(base_filename, username, ukuran, mulai, akhir)
+    else:
+        chunks = storage.iter_chunks(base_filename, username, ukuran)
+    for chunk in chunks:
+        if "Tanggal" in chunk.columns:
+            chunk["Tanggal"] = parse_tanggal(chunk["Tanggal"])
+        if terhapus is not None and not terhapus.empty and "ID" in chunk.columns:
+            chunk = chunk[~chunk["ID"].isin(terhapus)]
+        chunk = filter_tanggal(chunk, mulai, akhir)
+        if not chunk.empty:
+            yield chunk
+
+def iter_terurut(chunks, kelompok=None, ukuran=None):
+    # Urutkan aliran chunk menurut (kelompok, Tanggal) tanpa memuat semuanya: tiap chunk
+    # dipecah ke file sementara per (kelompok, bulan), lalu tiap bucket diurutkan stabil.
+    # Urutannya sama dengan sort_values stabil pada seluruh data (NaT di akhir).
+    # Bucket kecil digabung sampai sekitar `ukuran` baris per chunk keluaran, sehingga
+    # memori yang dipakai sebesar satu chunk atau satu bucket (mana yang lebih besar).
+    ukuran = ukuran or UKURAN_CHUNK
+    with tempfile.TemporaryDirectory(prefix="keuangan_ekspor_") as folder:
+        bucket = {}
+        for chunk in chunks:
+            bulan = chunk["Tanggal"].dt.strftime("%Y-%m").fillna("~")
+            kunci = [chunk[kelompok].astype(str), bulan] if kelompok else [bulan]
+            for k, grup in chunk.groupby(kunci, sort=False, dropna=False):
+                path = bucket.setdefault(k, os.path.join(folder, f"{len(bucket)}.pkl"))
+                with open(path, "ab") as f:
+                    pickle.dump(grup, f, protocol=pickle.HIGHEST_PROTOCOL)
+        siap, jumlah = [], 0
+        for k in sorted(bucket):
+            frames = []
+            with open(bucket[k], "rb") as f:
+                while True:
+                    try:
+                        frames.append(pickle.load(f))
+                    except EOFError:
+                        break
+            siap.append(pd.concat(frames).sort_values("Tanggal", kind="stable"))
+            jumlah += len(siap[-1])
+            if jumlah >= ukuran:
+                yield pd.concat(siap)
+                siap, jumlah = [], 0
+        if siap:
+            yield pd.concat(siap)
+
+def _baca_terkunci(username, chunks):
+    # Pembacaan (tahap memecah ke file sementara) dilakukan di dalam kunci pengguna
+    # supaya tidak tercampur tulisan yang sedang berjalan; penulisan file ekspor
+    # terjadi setelah kunci dilepas
+    with kunci_pengguna(username):
+        pertama = next(chunks, None)
+    if pertama is not None:
+        yield pertama
+        yield from chunks
+
+def iter_jurnal_umum(username, mulai=None, akhir=None):
+    return _baca_terkunci(username, iter_terurut(iter_data("jurnal.csv", username, mulai, akhir)))
+
+def iter_buku_besar(username, mulai=None, akhir=None, akun=None):
+    # Sama dengan hitung_buku_besar, tetapi per chunk: saldo akumulatif dibawa
+    # dari chunk sebelumnya untuk akun yang sama
+    chunks = iter_data("jurnal.csv", username, mulai, akhir)
+    if akun is not None:
+        chunks = (chunk[chunk["Akun"] == akun] for chunk in chunks)
+    saldo_awal = None
+    for chunk in _baca_terkunci(username, iter_terurut(chunks, "Akun")):
+        chunk = chunk.assign(Saldo=chunk["Debit"] - chunk["Kredit"])
+        akun_chunk = chunk["Akun"]
+        kumulatif = chunk["Saldo"].groupby(akun_chunk, sort=False).cumsum()
+        if saldo_awal is not None:
+            # map/fillna selalu menghasilkan float; kembalikan ke tipe Saldo (rupiah utuh tetap int)
+            kumulatif += akun_chunk.map(saldo_awal).fillna(0).astype(kumulatif.dtype)
+        chunk["Saldo Akumulatif"] = kumulatif
+        terakhir = kumulatif.groupby(akun_chunk, sort=False).last()
+        if saldo_awal is not None:
+            terakhir = terakhir.combine_first(saldo_awal).astype(kumulatif.dtype)
+        saldo_awal = terakhir
+        yield chunk
+
+def _teks_chunk(chunk, kolom):
+    # Tanggal jadi YYYY-MM-DD dan nilai kosong jadi None, siap ditulis per baris
+    chunk = chunk.reindex(columns=kolom)
+    if pd.api.types.is_datetime64_any_dtype(chunk["Tanggal"]):
+        chunk = chunk.assign(Tanggal=chunk["Tanggal"].dt.strftime("%Y-%m-%d"))
+    return chunk.astype(object).where(chunk.notna(), None)
+
+def tulis_csv(chunks, kolom, f):
+    teks = io.TextIOWrapper(f, encoding="utf-8", newline="")
+    csv.writer(teks).writerow(kolom)
+    for chunk in chunks:
+        chunk.reindex(columns=kolom).to_csv(teks, header=False, index=False, date_format="%Y-%m-%d")
+    teks.flush()
+    teks.detach()
+
+def tulis_xlsx(chunks, kolom, f, judul):
+    # Mode constant_memory: tiap baris langsung ditulis ke file sementara xlsxwriter
+    try:
+        import xlsxwriter
+    except ImportError as e:
+        raise ImportError("Ekspor Excel membutuhkan paket xlsxwriter (pip install xlsxwriter)") from e
+    workbook = xlsxwriter.Workbook(f, {"constant_memory": True, "in_memory": False})
+    tebal = workbook.add_format({"bold": True})
+    rupiah = workbook.add_format({"num_format": '"Rp" #,##0'})
+
+    def lembar_baru(nomor):
+        ws = workbook.add_worksheet(judul if nomor == 1 else f"{judul} ({nomor})")
+        ws.write_row(0, 0, kolom, tebal)
+        for i, nama in enumerate(kolom):
+            ws.set_column(i, i, 18 if nama in KOLOM_RUPIAH_EKSPOR else 14, rupiah if nama in KOLOM_RUPIAH_EKSPOR else None)
+        ws.freeze_panes(1, 0)
+        return ws
+
+    nomor, ws, baris = 1, lembar_baru(1), 1
+    for chunk in chunks:
+        for nilai in _teks_chunk(chunk, kolom).itertuples(index=False, name=None):
+            if baris == MAKS_BARIS_EXCEL:
+                # Batas baris Excel: lanjut di lembar berikutnya
+                nomor += 1
+                ws, baris = lembar_baru(nomor), 1
+            ws.write_row(baris, 0, nilai)
+            baris += 1
+    workbook.close()
+
+def tulis_pdf(chunks, kolom, f, judul):
+    # PDF berhalaman (A4 mendatar) dengan judul dan header kolom di setiap halaman
+    try:
+        from reportlab.lib.pagesizes import A4, landscape
+        from reportlab.pdfgen import canvas
+    except ImportError as e:
+        raise ImportError("Ekspor PDF membutuhkan paket reportlab (pip install reportlab)") from e
+    lebar, tinggi = landscape(A4)
+    tepi, tinggi_baris, ukuran_huruf = 30, 12, 7
+    bobot = {"Keterangan": 2.2, "ID": 1.6, "Akun": 1.6}
+    total_bobot = sum(bobot.get(k, 1) for k in kolom)
+    lebar_kolom = [(lebar - 2 * tepi) * bobot.get(k, 1) / total_bobot for k in kolom]
+    maks_huruf = [int(w / (ukuran_huruf * 0.5)) for w in lebar_kolom]
+    pdf = canvas.Canvas(f, pagesize=(lebar, tinggi), pageCompression=1)
+    halaman = 0
+
+    def header():
+        nonlocal halaman
+        halaman += 1
+        pdf.setFont("Helvetica-Bold", 11)
+        pdf.drawString(tepi, tinggi - tepi, judul)
+        pdf.setFont("Helvetica", 8)
+        pdf.drawRightString(lebar - tepi, tinggi - tepi, f"Halaman {halaman}")
+        pdf.setFont("Helvetica-Bold", ukuran_huruf)
+        y = tinggi - tepi - 2 * tinggi_baris
+        x = tepi
+        for nama, w in zip(kolom, lebar_kolom):
+            if nama in KOLOM_RUPIAH_EKSPOR:
+                pdf.drawRightString(x + w - 4, y, nama)
+            else:
+                pdf.drawString(x, y, nama)
+            x += w
+        pdf.line(tepi, y - 3, lebar - tepi, y - 3)
+        pdf.setFont("Helvetica", ukuran_huruf)
+        return y - tinggi_baris
+
+    y = header()
+    for chunk in chunks:
+        for nilai in _teks_chunk(chunk, kolom).itertuples(index=False, name=None):
+            if y < tepi:
+                pdf.showPage()
+                y = header()
+            x = tepi
+            for nama, isi, w, maks in zip(kolom, nilai, lebar_kolom, maks_huruf):
+                if isi is None:
+                    pass
+                elif nama in KOLOM_RUPIAH_EKSPOR:
+                    pdf.drawRightString(x + w - 4, y, f"Rp {isi:,.0f}")
+                else:
+                    pdf.drawString(x, y, str(isi)[:maks])
+                x += w
+            y -= tinggi_baris
+    pdf.showPage()
+    pdf.save()
+
+def ekspor(jenis, format_ekspor, username, f, mulai=None, akhir=None, akun=None):
+    # jenis: "jurnal" atau "buku_besar"; format_ekspor: kunci FORMAT_EKSPOR; f: file biner
+    kolom = KOLOM_EKSPOR[jenis]
+    judul = JUDUL_EKSPOR[jenis] + (f" - {akun}" if akun else "")
+    if jenis == "jurnal":
+        chunks = iter_jurnal_umum(username, mulai, akhir)
+    else:
+        chunks = iter_buku_besar(username, mulai, akhir, akun)
+    with ukur("ekspor", jenis=jenis, format=format_ekspor):
+        if format_ekspor == "CSV":
+            tulis_csv(chunks, kolom, f)
+        elif format_ekspor == "Excel":
+            tulis_xlsx(chunks, kolom, f, judul)
+        elif format_ekspor == "PDF":
+            tulis_pdf(chunks, kolom, f, f"{judul} ({username})")
+        else:
+            raise ValueError(f"Format ekspor tidak dikenal: {format_ekspor}")
+
+def file_ekspor(jenis, format_ekspor, username, mulai=None, akhir=None, akun=None):
+    # File sementara (otomatis terhapus saat ditutup) berisi hasil ekspor, siap dibaca dari awal.
+    # Data dibaca dan ditulis bertahap, tetapi st.download_button tetap membaca seluruh
+    # file ini ke memori saat unduhan dilayani; untuk ekspor yang sangat besar tulis
+    # langsung ke file tujuan dengan ekspor(...).
+    flush_tulisan(username)
+    f = tempfile.TemporaryFile()
+    try:
+        ekspor(jenis, format_ekspor, username, f, mulai, akhir, akun)
+    except Exception:
+        f.close()
+        raise
+    f.seek(0)
+    return f
+
+# ---------------- Agregat Kelompok Tani ----------------
+# Total gabungan semua anggota untuk admin, gaya map-reduce: tiap pengguna
+# dipadatkan dari ringkasan bulanannya (map), lalu semua hasil digabung (reduce).
+# Hasil per pengguna di-cache bersama versi datanya, sehingga pada run berikutnya
+# hanya pengguna yang datanya berubah yang dibaca ulang.
+
+KOLOM_AGREGAT = ["Bulan", "Jenis", "Kategori", "Sub Kategori", "Username", "Jumlah", "Transaksi"]
+
+_agregat_cache = {}        # username -> (versi, hasil map)
+_agregat_gabungan = None   # (versi semua pengguna, hasil reduce)
+_agregat_lock = threading.Lock()
+
+def versi_pengguna(username):
+    storage = get_storage()
+    return tuple(storage.version(b, username) for b in ("pemasukan.csv", "pengeluaran.csv", "hapus.csv"))
+
+def agregat_pengguna(username):
+    # Map: ringkasan bulanan satu pengguna tanpa pelunasan, per bulan dan sub kategori.
+    # Versi dibaca di dalam kunci supaya cocok dengan isi ringkasan yang dibaca.
+    with kunci_pengguna(username):
+        versi = versi_pengguna(username)
+        ringkasan = load_ringkasan_bulanan(username)
+    ringkasan = ringkasan[~ringkasan["Metode"].isin(METODE_PELUNASAN)]
+    hasil = ringkasan.groupby(["Bulan", "Jenis", "Kategori", "Sub Kategori"], as_index=False)[["Jumlah", "Transaksi"]].sum()
+    hasil["Username"] = username
+    return versi, hasil[KOLOM_AGREGAT]
+
+def agregat_kelompok(pengguna=None, maks_thread=None):
+    # Reduce: gabungan hasil map semua pengguna.
+    # Hasil: (DataFrame KOLOM_AGREGAT, daftar pengguna yang dihitung ulang pada run ini)
+    global _agregat_gabungan
+    daftar = sorted(pengguna) if pengguna is not None else get_storage().list_users()
+    versi = {username: versi_pengguna(username) for username in daftar}
+    with _agregat_lock:
+        berubah = [u for u in daftar if u not in _agregat_cache or _agregat_cache[u][0] != versi[u]]
+    if berubah:
+        # Yang dibaca hanya ringkasan bulanan (kecil), jadi thread cukup dan server
+        # Streamlit tidak perlu di-fork
+        with ThreadPoolExecutor(max_workers=maks_thread) as executor:
+            hasil = dict(zip(berubah, executor.map(agregat_pengguna, berubah)))
+        with _agregat_lock:
+            for username, (versi_baru, df) in hasil.items():
+                _agregat_cache[username] = (versi_baru, df)
+    with _agregat_lock:
+        for username in set(_agregat_cache) - set(daftar):
+            del _agregat_cache[username]
+        kunci = tuple((u, _agregat_cache[u][0]) for u in daftar)
+        if _agregat_gabungan is not None and _agregat_gabungan[0] == kunci:
+            return _agregat_gabungan[1], berubah
+        bagian = [_agregat_cache[u][1] for u in daftar]
+    gabungan = pd.concat(bagian, ignore_index=True) if bagian else pd.DataFrame(columns=KOLOM_AGREGAT)
+    with _agregat_lock:
+        _agregat_gabungan = (kunci, gabungan)
+    return gabungan, berubah
+
+def ringkas_kelompok(gabungan, bulan_mulai=None, bulan_akhir=None):
+    # Tabel dashboard dari hasil agregat_kelompok; bulan dalam format "YYYY-MM"
+    data = gabungan
+    if bulan_mulai is not None:
+        data = data[data["Bulan"] >= bulan_mulai]
+    if bulan_akhir is not None:
+        data = data[data["Bulan"] <= bulan_akhir]
+    masuk = data[data["Jenis"] == "Pemasukan"]
+    keluar = data[data["Jenis"] == "Pengeluaran"]
+
+    per_bulan = data.pivot_table(index="Bulan", columns="Jenis", values="Jumlah", aggfunc="sum")
+    per_bulan = per_bulan.reindex(columns=["Pemasukan", "Pengeluaran"]).fillna(0).sort_index()
+    per_bulan["Margin"] = per_bulan["Pemasukan"] - per_bulan["Pengeluaran"]
+
+    per_anggota = data.pivot_table(index="Username", columns="Jenis", values="Jumlah", aggfunc="sum")
+    per_anggota = per_anggota.reindex(columns=["Pemasukan", "Pengeluaran"]).fillna(0)
+    per_anggota["Margin"] = per_anggota["Pemasukan"] - per_anggota["Pengeluaran"]
+
+    per_sub_kategori = (
+        keluar.groupby(["Kategori", "Sub Kategori"], as_index=False)[["Jumlah", "Transaksi"]].sum()
+        .sort_values("Jumlah", ascending=False, kind="stable")
+    )
+    total_pemasukan = masuk["Jumlah"].sum()
+    total_pengeluaran = keluar["Jumlah"].sum()
+    return {
+        "anggota": data["Username"].nunique(),
+        "total_pemasukan": total_pemasukan,
+        "total_pengeluaran": total_pengeluaran,
+        "margin": total_pemasukan - total_pengeluaran,
+        "persen_margin": (total_pemasukan - total_pengeluaran) / total_pemasukan * 100 if total_pemasukan > 0 else 0,
+        "per_bulan": per_bulan,
+        "per_anggota": per_anggota.sort_values("Margin", ascending=False, kind="stable"),
+        "per_sub_kategori": per_sub_kategori,
+    }
+
+# ---------------- Status Penyimpanan ----------------
+# Tulisan dari form masuk antrian; tiketnya disimpan di session_state dan hasilnya
+# (terutama kegagalan) ditampilkan pada rerun berikutnya lewat tampilkan_status_tulisan.
+
+def kirim_transaksi(data, base_filename, jurnal, username, label):
+    try:
+        tiket = simpan_transaksi(data, base_filename, jurnal, username)
+    except Exception as e:
+        st.error(f"⚠️ {label} gagal disimpan: {e}")
+        return
+    if not tiket.done():
+        st.session_state.setdefault("tulisan_antre", []).append((label, username, tiket))
+        st.success(f"✅ {label} dicatat dan sedang disimpan.")
+    elif tiket.exception() is not None:
+        st.error(f"⚠️ {label} gagal disimpan: {tiket.exception()}")
+    else:
+        st.success(f"✅ {label} berhasil disimpan.")
+
+def tampilkan_status_tulisan():
+    # Laporkan tulisan yang gagal sejak rerun sebelumnya; yang belum selesai tetap dipantau
+    antre = []
+    for label, username, tiket in st.session_state.get("tulisan_antre", []):
+        if not tiket.done():
+            antre.append((label, username, tiket))
+        elif tiket.exception() is not None:
+            st.error(f"⚠️ {label} gagal disimpan: {tiket.exception()}")
+            if _write_queue is not None:
+                _write_queue.tandai_dilaporkan(username, tiket.exception())
+    st.session_state["tulisan_antre"] = antre
+
 # ---------------- Fungsi Pemasukan ----------------
 
 def pemasukan():
@@ -145,7 +2399,7 @@ def pemasukan():
     sumber = st.selectbox("Sumber Pemasukan", kategori_pemasukan["Sumber Pemasukan"])
     jumlah = st.number_input("Jumlah (Rp)", min_value=0)
     deskripsi = st.text_area("Keterangan (opsional)") 
-    metode = st.radio("Metode Penerimaan", ["Tunai", "Transfer", "Piutang", "Pelunasan Piutang"])
+    metode = st.radio("Metode Penerimaan", list(AKUN_METODE_PEMASUKAN))
 
     if st.button("✅ Simpan Pemasukan"):
         if not sumber.strip() or jumlah <= 0:
@@ -153,26 +2407,19 @@ def pemasukan():
             return
         waktu = tanggal.strftime("%Y-%m-%d %H:%M:%S")
         username = st.session_state['username']
+        id_transaksi = buat_id()
         data = {
             "Tanggal": waktu,
             "Sumber": sumber,
             "Jumlah": jumlah,
             "Metode": metode,
             "Keterangan": deskripsi,
-            "Username": username
+            "Username": username,
+            "ID": id_transaksi
         }
-        append_data(data, "pemasukan.csv", username)
-        akun_debit = {
-            "Tunai": "Kas",
-            "Transfer": "Bank",
-            "Piutang": "Piutang Dagang",
-            "Pelunasan Piutang": "Kas"
-        }[metode]
-        akun_kredit = "Pendapatan" if metode != "Pelunasan Piutang" else "Piutang Dagang"
-        jurnal = buat_jurnal(waktu, akun_debit, akun_kredit, jumlah, sumber)
-        for j in jurnal:
-            append_data(j, "jurnal.csv", username)
-        st.success("✅ Pemasukan berhasil disimpan.")
+        akun_debit, akun_kredit = akun_pemasukan(metode)
+        jurnal = buat_jurnal(waktu, akun_debit, akun_kredit, jumlah, sumber, id_transaksi)
+        kirim_transaksi(data, "pemasukan.csv", jurnal, username, "Pemasukan")
 
 # ---------------- Fungsi Pengeluaran ----------------
 
@@ -183,7 +2430,7 @@ def pengeluaran():
     sub_kategori = st.selectbox("Sub Kategori", kategori_pengeluaran[kategori])
     jumlah = st.number_input("Jumlah (Rp)", min_value=0)
     deskripsi = st.text_area("Keterangan (opsional)")
-    metode = st.radio("Metode Pembayaran", ["Tunai", "Transfer", "Utang", "Pelunasan Utang"])
+    metode = st.radio("Metode Pembayaran", list(AKUN_METODE_PENGELUARAN))
 
     if st.button("✅ Simpan Pengeluaran"):
         if jumlah <= 0:
@@ -191,6 +2438,7 @@ def pengeluaran():
             return
         waktu = tanggal.strftime("%Y-%m-%d %H:%M:%S")
         username = st.session_state['username']
+        id_transaksi = buat_id()
         data = {
             "Tanggal": waktu,
             "Kategori": kategori,
@@ -198,28 +2446,174 @@ def pengeluaran():
             "Jumlah": jumlah,
             "Keterangan": deskripsi,
             "Metode": metode,
-            "Username": username
+            "Username": username,
+            "ID": id_transaksi
         }
-        append_data(data, "pengeluaran.csv", username)
-        akun_kredit = {
-            "Tunai": "Kas",
-            "Transfer": "Bank",
-            "Utang": "Utang Dagang",
-            "Pelunasan Utang": "Kas"
-        }[metode]
-        akun_debit = sub_kategori if metode != "Pelunasan Utang" else "Utang Dagang"
-        jurnal = buat_jurnal(waktu, akun_debit, akun_kredit, jumlah, deskripsi)
-        for j in jurnal:
-            append_data(j, "jurnal.csv", username)
-        st.success("✅ Pengeluaran berhasil disimpan.")
-
-import streamlit as st
-from datetime import datetime
-import os
-import hashlib
-import pandas as pd
+        akun_debit, akun_kredit = akun_pengeluaran(metode, sub_kategori)
+        jurnal = buat_jurnal(waktu, akun_debit, akun_kredit, jumlah, deskripsi, id_transaksi)
+        kirim_transaksi(data, "pengeluaran.csv", jurnal, username, "Pengeluaran")
+
+# ---------------- Fungsi Impor Data ----------------
+
+def baca_file_impor(file):
+    # File CSV atau Excel (Excel butuh paket openpyxl)
+    nama = getattr(file, "name", str(file)).lower()
+    if nama.endswith((".xlsx", ".xls")):
+        return pd.read_excel(file)
+    return pd.read_csv(file)
+
+def validasi_impor(df, jenis):
+    # Periksa semua baris sekaligus per kolom. Hasil: (data bersih, tabel kesalahan).
+    # Nomor baris mengikuti file: baris 1 adalah header.
+    kolom_wajib = [k for k in KOLOM_DATA[jenis] if k not in ("Keterangan", "Username", "ID")]
+    hilang = [k for k in kolom_wajib if k not in df.columns]
+    if hilang:
+        return None, pd.DataFrame({"Baris": "-", "Kolom": hilang, "Pesan": "Kolom tidak ditemukan"})
+
+    df = df.reset_index(drop=True)
+    teks = {k: df[k].fillna("").astype(str).str.strip() for k in kolom_wajib if k not in ("Tanggal", "Jumlah")}
+    tanggal = parse_tanggal(df["Tanggal"])
+    jumlah = pd.to_numeric(df["Jumlah"], errors="coerce")
+
+    cek = [
+        ("Tanggal", tanggal.isna(), "Tanggal tidak valid"),
+        ("Jumlah", ~(jumlah > 0), "Jumlah harus angka lebih dari 0"),
+    ]
+    if jenis == "pemasukan":
+        cek.append(("Metode", ~teks["Metode"].isin(list(AKUN_METODE_PEMASUKAN)), "Metode penerimaan tidak dikenal"))
+        cek.append(("Sumber", ~teks["Sumber"].isin(kategori_pemasukan["Sumber Pemasukan"]), "Sumber pemasukan tidak dikenal"))
+    else:
+        pasangan = [f"{kat}|{sub}" for kat, daftar in kategori_pengeluaran.items() for sub in daftar]
+        cek.append(("Metode", ~teks["Metode"].isin(list(AKUN_METODE_PENGELUARAN)), "Metode pembayaran tidak dikenal"))
+        cek.append(("Kategori", ~teks["Kategori"].isin(list(kategori_pengeluaran)), "Kategori tidak dikenal"))
+        cek.append(("Sub Kategori", ~(teks["Kategori"] + "|" + teks["Sub Kategori"]).isin(pasangan),
+                    "Sub kategori tidak sesuai kategori"))
+
+    kesalahan = pd.concat([
+        pd.DataFrame({"Baris": df.index[mask] + 2, "Kolom": kolom, "Pesan": pesan})
+        for kolom, mask, pesan in cek if mask.any()
+    ] or [pd.DataFrame(columns=["Baris", "Kolom", "Pesan"])], ignore_index=True)
+    if not kesalahan.empty:
+        return None, kesalahan.sort_values("Baris", kind="stable", ignore_index=True)
+
+    if (jumlah % 1 == 0).all():
+        jumlah = jumlah.astype("int64")
+    bersih = pd.DataFrame({"Tanggal": tanggal.dt.strftime("%Y-%m-%d %H:%M:%S"), "Jumlah": jumlah})
+    for k, nilai in teks.items():
+        bersih[k] = nilai
+    bersih["Keterangan"] = df["Keterangan"].fillna("").astype(str) if "Keterangan" in df.columns else ""
+    return bersih, kesalahan
+
+def impor_transaksi(df, jenis, username):
+    # Impor banyak transaksi sekaligus: validasi per kolom, buat semua baris jurnal
+    # dengan pemetaan akun yang sama seperti form, lalu simpan dalam satu kali tulis.
+    # Jika ada kesalahan, tidak ada data yang disimpan. Hasil: (jumlah baris, tabel kesalahan).
+    bersih, kesalahan = validasi_impor(df, jenis)
+    if bersih is None:
+        return 0, kesalahan
+    bersih["Username"] = username
+    bersih["ID"] = buat_id_massal(len(bersih))
+    bersih = bersih[KOLOM_DATA[jenis]]
+    if not bersih.empty:
+        simpan_transaksi(bersih, f"{jenis}.csv", buat_jurnal_massal(bersih, jenis), username).result()
+    return len(bersih), kesalahan
+
+def impor_data():
+    st.subheader("Impor Transaksi dari File")
+    username = st.session_state['username']
+    jenis = st.radio("Jenis Transaksi", ["Pemasukan", "Pengeluaran"]).lower()
+    kolom = [k for k in KOLOM_DATA[jenis] if k not in ("Username", "ID")]
+    st.caption("Kolom file: " + ", ".join(kolom) + " (Keterangan opsional)")
+
+    file = st.file_uploader("File CSV atau Excel", type=["csv", "xlsx", "xls"])
+    if file is None:
+        return
+    try:
+        df = baca_file_impor(file)
+    except ImportError:
+        st.error("Membaca file Excel membutuhkan paket openpyxl.")
+        return
+    except Exception as e:
+        st.error(f"File tidak bisa dibaca: {e}")
+        return
+
+    st.write(f"{len(df)} baris terbaca. Contoh data:")
+    st.dataframe(df.head(20))
+
+    if st.button("📥 Impor Semua"):
+        jumlah, kesalahan = impor_transaksi(df, jenis, username)
+        if not kesalahan.empty:
+            st.error(f"Ditemukan {len(kesalahan)} kesalahan. Tidak ada data yang disimpan.")
+            st.dataframe(kesalahan.head(500))
+        else:
+            st.success(f"✅ {jumlah} transaksi berhasil diimpor.")
+
+# ---------------- Tabel Berhalaman ----------------
+# Tabel besar tidak dikirim utuh ke browser: pencarian dan pengurutan dilakukan
+# pada seluruh baris, tetapi hanya satu halaman yang diformat dan ditampilkan.
+
+UKURAN_HALAMAN = [25, 50, 100, 250, 500]
+
+def cari_baris(df, teks):
+    # Baris yang salah satu kolom teks/tanggalnya mengandung teks (tanpa membedakan huruf besar)
+    teks = teks.strip()
+    if not teks or df.empty:
+        return df
+    mask = pd.Series(False, index=df.index)
+    for kolom in df.columns:
+        seri = df[kolom]
+        if pd.api.types.is_datetime64_any_dtype(seri):
+            seri = seri.dt.strftime("%Y-%m-%d")
+        elif pd.api.types.is_numeric_dtype(seri):
+            continue
+        mask |= seri.astype(str).str.contains(teks, case=False, regex=False, na=False)
+    return df[mask]
 
-# ... (kode helper functions sebelumnya tetap sama) ...
+def format_halaman(df, kolom_rupiah=()):
+    # Format hanya baris yang tampil: tanggal jadi YYYY-MM-DD, jumlah jadi "Rp 1,000"
+    tampil = df.copy()
+    for kolom in tampil.columns:
+        if pd.api.types.is_datetime64_any_dtype(tampil[kolom]):
+            tampil[kolom] = tampil[kolom].dt.strftime("%Y-%m-%d")
+    for kolom in kolom_rupiah:
+        if kolom in tampil.columns:
+            tampil[kolom] = [f"Rp {x:,.0f}" if pd.notna(x) else "" for x in tampil[kolom]]
+    return tampil
+
+def tabel_berhalaman(df, key, kolom_rupiah=(), kolom_total=(), urut_default=None, menurun=False, tinggi=400):
+    # Tampilkan df per halaman dengan pencarian, pengurutan dan total.
+    # Hasil: potongan df (belum diformat) yang sedang tampil.
+    c1, c2, c3, c4 = st.columns([3, 2, 1, 1])
+    teks = c1.text_input("Cari", key=f"{key}_cari")
+    kolom = list(df.columns)
+    urut = c2.selectbox(
+        "Urutkan berdasarkan", kolom,
+        index=kolom.index(urut_default) if urut_default in kolom else 0, key=f"{key}_urut",
+    )
+    turun = c3.checkbox("Menurun", value=menurun, key=f"{key}_turun")
+    ukuran = c4.selectbox("Baris/halaman", UKURAN_HALAMAN, key=f"{key}_ukuran")
+
+    hasil = cari_baris(df, teks).sort_values(urut, ascending=not turun, kind="stable")
+    jumlah_halaman = max(1, -(-len(hasil) // ukuran))
+    if st.session_state.get(f"{key}_halaman", 1) > jumlah_halaman:
+        st.session_state[f"{key}_halaman"] = jumlah_halaman
+    halaman = st.number_input(
+        f"Halaman (dari {jumlah_halaman})", min_value=1, max_value=jumlah_halaman, step=1, key=f"{key}_halaman"
+    )
+    awal = (int(halaman) - 1) * ukuran
+    potongan = hasil.iloc[awal:awal + ukuran]
+
+    st.dataframe(format_halaman(potongan, kolom_rupiah), height=tinggi)
+    st.caption(f"Baris {awal + 1 if len(hasil) else 0}–{awal + len(potongan)} dari {len(hasil)}"
+               + (f" (hasil pencarian dari {len(df)})" if len(hasil) != len(df) else ""))
+
+    if kolom_total:
+        total = pd.DataFrame(
+            [potongan[list(kolom_total)].sum(), hasil[list(kolom_total)].sum()],
+            index=["Total halaman ini", "Total keseluruhan"],
+        )
+        st.dataframe(format_halaman(total, kolom_total))
+    return potongan
 
 # ---------------- Fungsi Hapus Transaksi (diperbarui) ----------------
 
@@ -227,39 +2621,73 @@ def hapus_transaksi():
     st.subheader("Hapus Transaksi")
     username = st.session_state['username']
     transaksi_type = st.radio("Jenis Transaksi", ["Pemasukan", "Pengeluaran"])
+    try:
+        flush_tulisan(username)
+    except Exception as e:
+        st.error(f"⚠️ Sebagian transaksi gagal disimpan: {e}")
     
-    if transaksi_type == "Pemasukan":
-        df = load_data("pemasukan.csv", username)
-        file_type = "pemasukan"
-    else:
-        df = load_data("pengeluaran.csv", username)
-        file_type = "pengeluaran"
+    base_filename = "pemasukan.csv" if transaksi_type == "Pemasukan" else "pengeluaran.csv"
+    df = load_data(base_filename, username)
     
     if df.empty:
         st.warning("Tidak ada data transaksi.")
         return
+
+    # Transaksi lama belum punya ID: lengkapi sekali, lalu muat ulang
+    if "ID" not in df.columns or df["ID"].isna().any():
+        try:
+            lengkapi_id(username)
+        except Exception as e:
+            st.error(f"⚠️ ID transaksi lama gagal dilengkapi: {e}")
+            return
+        df = load_data(base_filename, username)
     
-    df['Tanggal'] = pd.to_datetime(df['Tanggal'])
-    df = df.sort_values('Tanggal', ascending=False)
-    
-    st.dataframe(df.style.format({
-        'Tanggal': lambda x: x.strftime('%Y-%m-%d'),
-        'Jumlah': 'Rp {:.0f}'.format
-    }), height=400)
+    halaman = tabel_berhalaman(
+        df, key=f"hapus_{base_filename}", kolom_rupiah=["Jumlah"], kolom_total=["Jumlah"],
+        urut_default="Tanggal", menurun=True,
+    )
+    if halaman.empty:
+        return
     
-    index_to_delete = st.selectbox("Pilih nomor transaksi yang akan dihapus", df.index)
+    # Pilihan hanya dari baris di halaman yang sedang tampil
+    label = halaman.set_index("ID")
+    keterangan_kolom = "Sumber" if transaksi_type == "Pemasukan" else "Sub Kategori"
+    id_to_delete = st.selectbox(
+        "Pilih transaksi yang akan dihapus", label.index,
+        format_func=lambda i: f"{label.at[i, 'Tanggal']:%Y-%m-%d} · {label.at[i, keterangan_kolom]} · Rp {label.at[i, 'Jumlah']:,.0f} ({i})"
+    )
     
     if st.button("🗑️ Hapus Transaksi"):
-        if hapus_transaksi(file_type, index_to_delete, username):
+        try:
+            terhapus = hapus_transaksi_id(id_to_delete, base_filename, username)
+        except Exception as e:
+            st.error(f"Gagal menghapus transaksi: {e}")
+            return
+        if terhapus:
             st.success("Transaksi berhasil dihapus!")
             st.rerun()
         else:
             st.error("Gagal menghapus transaksi.")
 
+# ---------------- Tombol Ekspor ----------------
+
+def tombol_ekspor(jenis, username, mulai, akhir, key, akun=None):
+    # File baru dibuat saat tombol unduh diklik (data callable), bukan di setiap rerun
+    with st.expander("⬇️ Ekspor"):
+        format_ekspor = st.radio("Format", list(FORMAT_EKSPOR), horizontal=True, key=f"{key}_format")
+        ekstensi, mime = FORMAT_EKSPOR[format_ekspor]
+        nama = f"{jenis}_{username}_{mulai}_{akhir}" + (f"_{akun}" if akun else "")
+        st.download_button(
+            f"Unduh {JUDUL_EKSPOR[jenis]} ({format_ekspor})",
+            data=lambda: file_ekspor(jenis, format_ekspor, username, mulai, akhir, akun),
+            file_name=f"{nama}.{ekstensi}",
+            mime=mime,
+            key=f"{key}_unduh",
+        )
+
 # ---------------- Fungsi Laporan (diperbarui) ----------------
 
 def laporan():
-    import plotly.express as px
     st.header("📊 Laporan Keuangan")
     username = st.session_state['username']
 
@@ -269,107 +2697,94 @@ def laporan():
     with col2:
         akhir = st.date_input("Tanggal Akhir", datetime.now())
 
-    pemasukan_df = load_data("pemasukan.csv", username)
-    pengeluaran_df = load_data("pengeluaran.csv", username)
-    jurnal_df = load_data("jurnal.csv", username)
+    # Tunggu transaksi yang masih antre supaya ikut terbaca
+    try:
+        with ukur("flush_tulisan"):
+            flush_tulisan(username)
+    except Exception as e:
+        st.error(f"⚠️ Sebagian transaksi gagal disimpan: {e}")
 
-    # Konversi tanggal
-    for df in [pemasukan_df, pengeluaran_df, jurnal_df]:
-        if not df.empty and "Tanggal" in df.columns:
-            df["Tanggal"] = pd.to_datetime(df["Tanggal"], errors='coerce')
+    # Data langsung difilter berdasarkan tanggal saat dimuat
+    pemasukan_df = load_data("pemasukan.csv", username, mulai, akhir)
+    pengeluaran_df = load_data("pengeluaran.csv", username, mulai, akhir)
+    jurnal_df = load_data("jurnal.csv", username, mulai, akhir)
 
-    # Filter berdasarkan tanggal
-    pemasukan_df = pemasukan_df[(pemasukan_df['Tanggal'] >= pd.to_datetime(mulai)) & 
-                               (pemasukan_df['Tanggal'] <= pd.to_datetime(akhir))]
-    pengeluaran_df = pengeluaran_df[(pengeluaran_df['Tanggal'] >= pd.to_datetime(mulai)) & 
-                                   (pengeluaran_df['Tanggal'] <= pd.to_datetime(akhir))]
-    jurnal_df = jurnal_df[(jurnal_df['Tanggal'] >= pd.to_datetime(mulai)) & 
-                          (jurnal_df['Tanggal'] <= pd.to_datetime(akhir))]
+    # Total per akun dihitung sekali, dipakai oleh Ringkasan, Laba Rugi dan Neraca
+    with ukur("laporan.saldo_akun"):
+        hasil = ringkas_keuangan(hitung_saldo_akun(jurnal_df))
 
     tabs = st.tabs(["Ringkasan", "Jurnal Umum", "Buku Besar", "Laba Rugi", "Neraca"])
     
-    with tabs[0]:
+    with tabs[0], ukur("laporan.ringkasan"):
         st.subheader("Ringkasan Keuangan")
+        if st.button("🔄 Hitung Ulang Ringkasan Bulanan"):
+            rebuild_ringkasan_bulanan(username)
         
-        total_pemasukan = pemasukan_df['Jumlah'].sum() if not pemasukan_df.empty else 0
-        total_pengeluaran = pengeluaran_df['Jumlah'].sum() if not pengeluaran_df.empty else 0
+        # Total dan trend dibaca dari ringkasan bulanan (tanpa pelunasan piutang/utang)
+        ringkasan = hitung_ringkasan(username, pemasukan_df, pengeluaran_df, mulai, akhir)
+        monthly_data = ringkasan["bulanan"]
+        total_pemasukan = ringkasan["total_pemasukan"]
+        total_pengeluaran = ringkasan["total_pengeluaran"]
         
         col1, col2, col3 = st.columns(3)
         col1.metric("Total Pemasukan", f"Rp {total_pemasukan:,.0f}")
         col2.metric("Total Pengeluaran", f"Rp {total_pengeluaran:,.0f}")
-        col3.metric("Saldo Bersih", f"Rp {total_pemasukan - total_pengeluaran:,.0f}", 
-                   delta=f"{((total_pemasukan - total_pengeluaran)/total_pemasukan*100 if total_pemasukan>0 else 0):.1f}%")
+        col3.metric("Saldo Bersih", f"Rp {ringkasan['saldo_bersih']:,.0f}", 
+                   delta=f"{ringkasan['persen_saldo']:.1f}%")
         
         if total_pemasukan > 0 or total_pengeluaran > 0:
             df_sum = pd.DataFrame({
                 'Kategori': ['Pemasukan', 'Pengeluaran'],
                 'Jumlah': [total_pemasukan, total_pengeluaran]
             })
-            fig = px.pie(df_sum, values='Jumlah', names='Kategori', title='Komposisi Pemasukan dan Pengeluaran')
-            st.plotly_chart(fig)
-            
-            # Grafik trend bulanan
-            if not pemasukan_df.empty and not pengeluaran_df.empty:
-                monthly_data = pd.concat([
-                    pemasukan_df.groupby(pd.Grouper(key='Tanggal', freq='M'))['Jumlah'].sum().rename('Pemasukan'),
-                    pengeluaran_df.groupby(pd.Grouper(key='Tanggal', freq='M'))['Jumlah'].sum().rename('Pengeluaran')
-                ], axis=1).fillna(0)
-                
-                monthly_data.index = monthly_data.index.strftime('%Y-%m')
-                fig = px.bar(monthly_data, barmode='group', title='Trend Bulanan')
+            with ukur("laporan.grafik"):
+                fig = px.pie(df_sum, values='Jumlah', names='Kategori', title='Komposisi Pemasukan dan Pengeluaran')
                 st.plotly_chart(fig)
+                
+                # Grafik trend bulanan
+                if not monthly_data.empty:
+                    fig = px.bar(monthly_data, barmode='group', title='Trend Bulanan')
+                    st.plotly_chart(fig)
 
-    with tabs[1]:
+    with tabs[1], ukur("laporan.jurnal_umum"):
         st.subheader("Jurnal Umum")
         if not jurnal_df.empty:
-            jurnal_df['Tanggal'] = jurnal_df['Tanggal'].dt.strftime('%Y-%m-%d')
-            st.dataframe(jurnal_df.style.format({
-                'Debit': 'Rp {:.0f}'.format,
-                'Kredit': 'Rp {:.0f}'.format
-            }), height=600)
+            tabel_berhalaman(
+                jurnal_df, key="jurnal_umum", kolom_rupiah=["Debit", "Kredit"],
+                kolom_total=["Debit", "Kredit"], urut_default="Tanggal", tinggi=600,
+            )
+            tombol_ekspor("jurnal", username, mulai, akhir, key="ekspor_jurnal")
         else:
             st.warning("Tidak ada data jurnal pada periode ini.")
 
-    with tabs[2]:
+    with tabs[2], ukur("laporan.buku_besar"):
         st.subheader("Buku Besar")
         if not jurnal_df.empty:
             akun_list = jurnal_df['Akun'].unique()
             selected_akun = st.selectbox("Pilih Akun", akun_list)
             
-            df_akun = jurnal_df[jurnal_df['Akun'] == selected_akun].copy()
-            df_akun = df_akun.sort_values("Tanggal")
-            df_akun['Saldo'] = df_akun['Debit'] - df_akun['Kredit']
-            df_akun['Saldo Akumulatif'] = df_akun['Saldo'].cumsum()
+            # Saldo akumulatif dihitung di seluruh baris akun sebelum dipotong per halaman
+            df_akun = hitung_buku_besar(jurnal_df, selected_akun)
             
-            st.dataframe(df_akun.style.format({
-                'Debit': 'Rp {:.0f}'.format,
-                'Kredit': 'Rp {:.0f}'.format,
-                'Saldo': 'Rp {:.0f}'.format,
-                'Saldo Akumulatif': 'Rp {:.0f}'.format
-            }), height=400)
+            tabel_berhalaman(
+                df_akun, key="buku_besar", kolom_rupiah=["Debit", "Kredit", "Saldo", "Saldo Akumulatif"],
+                kolom_total=["Debit", "Kredit", "Saldo"], urut_default="Tanggal",
+            )
+            semua_akun = st.checkbox("Ekspor semua akun", value=True, key="ekspor_semua_akun")
+            tombol_ekspor("buku_besar", username, mulai, akhir, key="ekspor_buku_besar",
+                          akun=None if semua_akun else selected_akun)
         else:
             st.warning("Tidak ada data jurnal pada periode ini.")
 
-    with tabs[3]:
+    with tabs[3], ukur("laporan.laba_rugi"):
         st.subheader("Laporan Laba Rugi")
         if not jurnal_df.empty:
-            # Hitung pendapatan
-            pendapatan = jurnal_df[jurnal_df['Akun'] == 'Pendapatan']['Kredit'].sum()
-            
-            # Hitung beban (semua akun selain Kas, Bank, Piutang, Utang, Pendapatan)
-            akun_beban = [akun for akun in jurnal_df['Akun'].unique() 
-                         if akun not in ['Kas', 'Bank', 'Piutang Dagang', 'Utang Dagang', 'Pendapatan']]
-            beban = jurnal_df[jurnal_df['Akun'].isin(akun_beban)]['Debit'].sum()
-            
-            laba_rugi = pendapatan - beban
+            pendapatan = hasil["pendapatan"]
+            beban = hasil["beban"]
+            laba_rugi = hasil["laba_rugi"]
             
             # Buat tabel laba rugi
-            lr_data = [
-                {"Keterangan": "Pendapatan", "Jumlah": pendapatan},
-                {"Keterangan": "Beban", "Jumlah": beban},
-                {"Keterangan": "Laba (Rugi)", "Jumlah": laba_rugi}
-            ]
-            lr_df = pd.DataFrame(lr_data)
+            lr_df = tabel_laba_rugi(hasil)
             
             st.dataframe(lr_df.style.format({
                 'Jumlah': 'Rp {:.0f}'.format
@@ -384,71 +2799,114 @@ def laporan():
         else:
             st.warning("Tidak ada data jurnal pada periode ini.")
 
-    with tabs[4]:
+    with tabs[4], ukur("laporan.neraca"):
         st.subheader("Neraca")
-        if not jurnal_df.empty:
-            # Hitung aktiva
-            kas = jurnal_df[jurnal_df['Akun'] == 'Kas']['Debit'].sum() - jurnal_df[jurnal_df['Akun'] == 'Kas']['Kredit'].sum()
-            bank = jurnal_df[jurnal_df['Akun'] == 'Bank']['Debit'].sum() - jurnal_df[jurnal_df['Akun'] == 'Bank']['Kredit'].sum()
-            piutang = jurnal_df[jurnal_df['Akun'] == 'Piutang Dagang']['Debit'].sum() - jurnal_df[jurnal_df['Akun'] == 'Piutang Dagang']['Kredit'].sum()
-            total_aktiva = kas + bank + piutang
-            
-            # Hitung kewajiban
-            utang = jurnal_df[jurnal_df['Akun'] == 'Utang Dagang']['Kredit'].sum() - jurnal_df[jurnal_df['Akun'] == 'Utang Dagang']['Debit'].sum()
-            total_kewajiban = utang
-            
-            # Hitung ekuitas (dari laba rugi)
-            pendapatan = jurnal_df[jurnal_df['Akun'] == 'Pendapatan']['Kredit'].sum()
-            beban = jurnal_df[~jurnal_df['Akun'].isin(['Kas', 'Bank', 'Piutang Dagang', 'Utang Dagang', 'Pendapatan'])]['Debit'].sum()
-            ekuitas = pendapatan - beban
-            
-            # Buat tabel neraca
-            neraca_data = [
-                {"Keterangan": "AKTIVA", "Jumlah": ""},
-                {"Keterangan": "- Kas", "Jumlah": kas},
-                {"Keterangan": "- Bank", "Jumlah": bank},
-                {"Keterangan": "- Piutang Dagang", "Jumlah": piutang},
-                {"Keterangan": "Total Aktiva", "Jumlah": total_aktiva},
-                {"Keterangan": "", "Jumlah": ""},
-                {"Keterangan": "KEWAJIBAN", "Jumlah": ""},
-                {"Keterangan": "- Utang Dagang", "Jumlah": utang},
-                {"Keterangan": "Total Kewajiban", "Jumlah": total_kewajiban},
-                {"Keterangan": "", "Jumlah": ""},
-                {"Keterangan": "EKUITAS", "Jumlah": ""},
-                {"Keterangan": "- Laba (Rugi) Bersih", "Jumlah": ekuitas},
-                {"Keterangan": "Total Ekuitas", "Jumlah": ekuitas},
-                {"Keterangan": "", "Jumlah": ""},
-                {"Keterangan": "TOTAL KEWAJIBAN + EKUITAS", "Jumlah": total_kewajiban + ekuitas}
-            ]
-            neraca_df = pd.DataFrame(neraca_data)
+        # Neraca memakai saldo kumulatif sampai tanggal akhir (snapshot penutupan + jurnal sesudahnya)
+        saldo_neraca = saldo_kumulatif(username, akhir)
+        if not saldo_neraca.empty:
+            hasil_neraca = ringkas_keuangan(saldo_neraca)
+            st.caption(f"Saldo per {akhir:%d-%m-%Y}, sejak transaksi pertama.")
+            # Buat tabel neraca (akun aktiva dan kewajiban mengikuti BAGAN_AKUN)
+            neraca_df = tabel_neraca(hasil_neraca)
             
             st.dataframe(neraca_df.style.format({
                 'Jumlah': lambda x: 'Rp {:.0f}'.format(x) if isinstance(x, (int, float)) else x
             }), height=600)
             
             # Validasi neraca
-            if abs(total_aktiva - (total_kewajiban + ekuitas)) > 1:  # Toleransi 1 rupiah
+            if not neraca_seimbang(hasil_neraca):
                 st.error("⚠️ Neraca tidak balance! Harap periksa data transaksi Anda.")
         else:
             st.warning("Tidak ada data jurnal pada periode ini.")
 
+# ---------------- Fungsi Kelompok Tani (admin) ----------------
+
+def kelompok_tani():
+    st.header("👥 Kelompok Tani")
+    st.caption("Gabungan seluruh anggota, tanpa pelunasan piutang/utang.")
+
+    with ukur("agregat_kelompok"):
+        gabungan, berubah = agregat_kelompok()
+    if berubah:
+        st.caption(f"Diperbarui dari data {len(berubah)} anggota yang berubah.")
+    if gabungan.empty:
+        st.warning("Belum ada data anggota.")
+        return
+
+    daftar_bulan = sorted(gabungan["Bulan"].unique())
+    if len(daftar_bulan) > 1:
+        bulan_mulai, bulan_akhir = st.select_slider(
+            "Periode", options=daftar_bulan, value=(daftar_bulan[0], daftar_bulan[-1])
+        )
+    else:
+        bulan_mulai = bulan_akhir = daftar_bulan[0]
+    hasil = ringkas_kelompok(gabungan, bulan_mulai, bulan_akhir)
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Anggota", hasil["anggota"])
+    col2.metric("Total Pemasukan", f"Rp {hasil['total_pemasukan']:,.0f}")
+    col3.metric("Total Pengeluaran", f"Rp {hasil['total_pengeluaran']:,.0f}")
+    col4.metric("Margin Bersih", f"Rp {hasil['margin']:,.0f}", delta=f"{hasil['persen_margin']:.1f}%")
+
+    st.subheader("Pemasukan dan Pengeluaran per Bulan")
+    if not hasil["per_bulan"].empty:
+        st.plotly_chart(px.bar(hasil["per_bulan"][["Pemasukan", "Pengeluaran"]], barmode='group'))
+    st.dataframe(format_halaman(hasil["per_bulan"], ["Pemasukan", "Pengeluaran", "Margin"]))
+
+    st.subheader("Pengeluaran per Sub Kategori")
+    st.dataframe(format_halaman(hasil["per_sub_kategori"], ["Jumlah"]), hide_index=True)
+
+    st.subheader("Per Anggota")
+    st.dataframe(format_halaman(hasil["per_anggota"], ["Pemasukan", "Pengeluaran", "Margin"]))
+
 # ---------------- UI Utama (diperbarui) ----------------
 
+def panel_debug_waktu():
+    # Durasi tiap bagian pada rerun ini (hanya untuk admin, lihat KEUANGAN_ADMIN)
+    with st.sidebar.expander("🐞 Debug Waktu"):
+        catatan = catatan_rerun()
+        if not catatan:
+            st.caption("Belum ada catatan waktu.")
+            return
+        df = pd.DataFrame(catatan).reindex(columns=["nama", "berkas", "durasi_ms"])
+        halaman = df[df["nama"].str.startswith("halaman.")]
+        st.metric("Durasi halaman", f"{halaman['durasi_ms'].sum():,.1f} ms")
+        st.dataframe(df, hide_index=True)
+        st.caption("Per bagian")
+        st.dataframe(
+            df.groupby("nama")["durasi_ms"].agg(["count", "sum", "max"]).sort_values("sum", ascending=False)
+        )
+        if LOG_WAKTU:
+            st.caption(f"Log lengkap: {LOG_WAKTU}")
+
 def main():
+    try:
+        tampilkan_aplikasi()
+    finally:
+        selesai_rerun()  # Juga saat rerun dihentikan st.rerun()/st.stop()
+
+def tampilkan_aplikasi():
     st.set_page_config(layout="wide", page_title="Aplikasi Keuangan Petani", page_icon="🌾")
    
     # Logo kecil di header (ganti dengan URL/logo sendiri jika ada)
     st.sidebar.title("🌾 Menu Utama")
     
-    logged_in = login_register()
+    mulai_rerun(st.session_state.get('username', ""))
+    with ukur("halaman.Login"):
+        logged_in = login_register()
     if not logged_in:
         return
     
-    menu = st.sidebar.radio("Navigasi", ["Beranda", "Pemasukan", "Pengeluaran", "Hapus Transaksi", "Laporan", "Logout"])
+    daftar_menu = ["Beranda", "Pemasukan", "Pengeluaran", "Impor Data", "Hapus Transaksi", "Laporan", "Logout"]
+    if is_admin(st.session_state['username']):
+        daftar_menu.insert(-1, "Kelompok Tani")
+    menu = st.sidebar.radio("Navigasi", daftar_menu)
+    tampilkan_status_tulisan()
 
-    if menu == "Beranda":
-        st.title(f"Selamat datang, {st.session_state['username']}!")
-        st.markdown("""
+    with ukur(f"halaman.{menu}"):
+        if menu == "Beranda":
+            st.title(f"Selamat datang, {st.session_state['username']}!")
+            st.markdown("""
         <style>
         .welcome-box {
             background-color: #f0f2f6;
@@ -462,6 +2920,7 @@ def main():
             <p>Fitur lengkap untuk mengelola keuangan usaha tani Anda:</p>
             <ul>
                 <li>📥 Tambah pemasukan dan pengeluaran</li>
+                <li>📂 Impor transaksi dari file CSV/Excel</li>
                 <li>📖 Jurnal umum otomatis</li>
                 <li>📊 Buku besar dan laporan keuangan</li>
                 <li>💰 Laporan laba rugi dan neraca</li>
@@ -470,25 +2929,68 @@ def main():
         </div>
         """, unsafe_allow_html=True)
         
-        st.info("Gunakan menu di sebelah kiri untuk navigasi.")
+            st.info("Gunakan menu di sebelah kiri untuk navigasi.")
+
+        elif menu == "Pemasukan":
+            pemasukan()
 
-    elif menu == "Pemasukan":
-        pemasukan()
+        elif menu == "Pengeluaran":
+            pengeluaran()
 
-    elif menu == "Pengeluaran":
-        pengeluaran()
+        elif menu == "Impor Data":
+            impor_data()
         
-    elif menu == "Hapus Transaksi":
-        hapus_transaksi()
+        elif menu == "Hapus Transaksi":
+            hapus_transaksi()
 
-    elif menu == "Laporan":
-        laporan()
+        elif menu == "Laporan":
+            laporan()
 
-    elif menu == "Logout":
-        st.session_state['logged_in'] = False
-        st.session_state['username'] = ""
-        st.success("Anda telah berhasil logout.")
-        st.rerun()
+        elif menu == "Kelompok Tani":
+            kelompok_tani()
+
+        elif menu == "Logout":
+            st.session_state['logged_in'] = False
+            st.session_state['username'] = ""
+            st.success("Anda telah berhasil logout.")
+            st.rerun()
+
+    if is_admin(st.session_state['username']):
+        panel_debug_waktu()
 
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1 and sys.argv[1] == "migrasi-sqlite":
+        # python sim.py migrasi-sqlite [keuangan.db]
+        db_path = sys.argv[2] if len(sys.argv) > 2 else "keuangan.db"
+        for (username, base_filename), n in migrate_csv_to_sqlite(db_path).items():
+            print(f"{username}: {base_filename} -> {n} baris")
+    elif len(sys.argv) > 1 and sys.argv[1] == "migrasi-parquet":
+        # python sim.py migrasi-parquet [folder]
+        tujuan_folder = sys.argv[2] if len(sys.argv) > 2 else "data"
+        for (username, base_filename), n in migrate_csv_to_parquet(tujuan_folder).items():
+            print(f"{username}: {base_filename} -> {n} baris")
+    elif len(sys.argv) > 1 and sys.argv[1] == "laporan-batch":
+        # python sim.py laporan-batch [YYYY-MM | YYYY-MM-DD:YYYY-MM-DD] [folder_output] [jumlah_proses]
+        mulai, akhir = periode_laporan(sys.argv[2] if len(sys.argv) > 2 else None)
+        folder_output = sys.argv[3] if len(sys.argv) > 3 else "laporan"
+        proses = int(sys.argv[4]) if len(sys.argv) > 4 else None
+        indeks = laporan_batch(mulai, akhir, folder_output, proses)
+        print(f"Laporan {mulai} s/d {akhir}: {len(indeks)} pengguna -> {folder_output}")
+        print(indeks.to_string(index=False))
+    elif len(sys.argv) > 1 and sys.argv[1] == "tutup-buku":
+        # python sim.py tutup-buku [YYYY-MM]
+        sampai = sys.argv[2] if len(sys.argv) > 2 else None
+        for username in get_storage().list_users():
+            print(f"{username}: {tutup_periode(username, sampai)} bulan ditutup")
+    elif len(sys.argv) > 1 and sys.argv[1] == "kompaksi-parquet":
+        # python sim.py kompaksi-parquet [folder]
+        storage = ParquetStorage(sys.argv[2] if len(sys.argv) > 2 else "data")
+        for username in storage.list_users():
+            for base_filename in FILE_DATA:
+                n = storage.compact(base_filename, username)
+                print(f"{username}: {base_filename} -> {n} partisi dikompaksi")
+    else:
+        # Streamlit menjalankan file ini sebagai __main__ dalam namespace baru di setiap
+        # rerun. State proses (cache, antrian tulis, instrumentasi) harus bertahan antar
+        # rerun, jadi pakai main() dari modul yang diimpor sekali (tersimpan di sys.modules).
+        importlib.import_module(os.path.splitext(os.path.basename(__file__))[0]).main()
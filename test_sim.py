@@ -0,0 +1,302 @@
+# Uji jalur data sim.py yang mudah salah diam-diam: cache load_data yang diperbarui
+# di tempat dan saldo Neraca dari snapshot penutupan bulanan.
+#
+#   python -m pytest test_sim.py
+#
+# Tiap uji berjalan di folder sementara, untuk backend csv, sqlite dan parquet.
+
+import os
+import random
+from datetime import date, timedelta
+
+# Tulis langsung (tanpa antrian) dan tanpa log waktu
+os.environ.setdefault("KEUANGAN_ANTRIAN", "0")
+os.environ.setdefault("KEUANGAN_LOG_WAKTU", "")
+
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+import bench
+import sim
+
+BACKEND = {
+    "csv": lambda: sim.CsvStorage("."),
+    "sqlite": lambda: sim.SqliteStorage("keuangan.db"),
+    "parquet": lambda: sim.ParquetStorage("data"),
+}
+FILE_TRANSAKSI = ("pemasukan.csv", "pengeluaran.csv", "jurnal.csv")
+
+@pytest.fixture(params=list(BACKEND))
+def storage(request, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("KEUANGAN_STORAGE", request.param)
+    storage = BACKEND[request.param]()
+    sim.set_storage(storage)
+    yield storage
+    sim.flush_tulisan()
+    sim.set_storage(None)
+
+def samakan(df):
+    # Keterangan kosong bisa terbaca "" / NaN / None tergantung backend
+    if "Keterangan" in df.columns:
+        df = df.assign(Keterangan=df["Keterangan"].astype(object).where(df["Keterangan"].notna(), None))
+    return df.reset_index(drop=True)
+
+def cek_sama_dengan_muat_ulang(storage, username):
+    dari_cache = {f: sim.load_data(f, username) for f in FILE_TRANSAKSI}
+    sim.clear_cache()
+    for f, df in dari_cache.items():
+        assert_frame_equal(
+            samakan(df), samakan(sim.load_data(f, username)),
+            check_dtype=not isinstance(storage, sim.ParquetStorage),
+            check_categorical=not isinstance(storage, sim.ParquetStorage),
+            obj=f,
+        )
+        assert df["Tanggal"].is_monotonic_increasing, f
+    return dari_cache
+
+def pengeluaran(tanggal, jumlah, sub_kategori="Urea", keterangan="", kategori="Pupuk"):
+    data = {
+        "Tanggal": tanggal, "Kategori": kategori, "Sub Kategori": sub_kategori, "Jumlah": jumlah,
+        "Keterangan": keterangan, "Metode": "Tunai", "Username": "u", "ID": sim.buat_id(),
+    }
+    akun_debit, akun_kredit = sim.akun_pengeluaran("Tunai", sub_kategori)
+    return data, sim.buat_jurnal(tanggal, akun_debit, akun_kredit, jumlah, keterangan, data["ID"])
+
+def pemasukan(tanggal, jumlah):
+    data = {
+        "Tanggal": tanggal, "Sumber": "Penjualan Padi", "Jumlah": jumlah, "Metode": "Tunai",
+        "Keterangan": "", "Username": "u", "ID": sim.buat_id(),
+    }
+    return data, sim.buat_jurnal(tanggal, "Kas", "Pendapatan", jumlah, "Penjualan Padi", data["ID"])
+
+# ---------------- Cache load_data ----------------
+
+def test_urutkan_dan_potong_tanggal():
+    rng = np.random.default_rng(1)
+    for percobaan in range(200):
+        n = int(rng.integers(0, 60))
+        hari = np.sort(rng.integers(0, 30, n))
+        for _ in range(int(rng.integers(0, 6))):  # beberapa baris mundur
+            if n:
+                hari[rng.integers(0, n)] = rng.integers(0, 30)
+        tanggal = pd.Series(pd.Timestamp("2024-01-01") + pd.to_timedelta(hari, unit="D"))
+        if n and percobaan % 3 == 0:
+            tanggal[rng.integers(0, n)] = pd.NaT
+        df = pd.DataFrame({"Tanggal": tanggal, "Akun": pd.Categorical(rng.choice(list("abc"), n)), "i": np.arange(n)})
+        urut = df.sort_values("Tanggal", kind="stable").reset_index(drop=True)
+        assert_frame_equal(sim.urutkan_tanggal(df).reset_index(drop=True), urut)
+        for mulai, akhir in [
+            (None, "2024-01-10"), ("2024-01-05", None), ("2024-01-05", "2024-01-05 23:59:59"),
+            (date(2023, 1, 1), date(2025, 1, 1)), ("2024-02-01", None), ("2024-01-20", "2024-01-10"),
+        ]:
+            assert_frame_equal(sim.potong_tanggal(urut, mulai, akhir), sim.filter_tanggal(urut, mulai, akhir))
+
+def test_cache_sama_dengan_muat_ulang(storage):
+    random.seed(0)
+    n = 600
+    kategori = random.choices(list(sim.kategori_pengeluaran), k=n)
+    sim.impor_transaksi(pd.DataFrame({
+        "Tanggal": [(date(2024, 1, 1) + timedelta(days=i // 10)).isoformat() for i in range(n)],
+        "Kategori": kategori,
+        "Sub Kategori": [random.choice(sim.kategori_pengeluaran[k]) for k in kategori],
+        "Jumlah": [random.randint(1_000, 100_000) for _ in range(n)],
+        "Metode": random.choices(list(sim.AKUN_METODE_PENGELUARAN), k=n),
+    }), "pengeluaran", "u")
+    for f in FILE_TRANSAKSI:
+        sim.load_data(f, "u")  # pemasukan.csv masih kosong
+
+    muat = []
+    load_asli = storage.load
+    storage.load = lambda base_filename, *args, **kwargs: (muat.append(base_filename), load_asli(base_filename, *args, **kwargs))[1]
+
+    # Tulisan mundur, hari yang sama, sesudah data terakhir, sebelum data pertama,
+    # kategori baru, Keterangan kosong/None, lalu pemasukan pertama (cache kosong)
+    for tanggal, jumlah, sub_kategori, keterangan in [
+        ("2024-01-03 00:00:00", 5_000, "Urea", ""),
+        ("2024-05-01 10:00:00", 5_001, "Urea", None),
+        ("2024-02-10 00:00:00", 5_002, "Urea X", "baru"),
+        ("2023-12-31 00:00:00", 5_003, "Urea", "awal"),
+    ]:
+        data, jurnal = pengeluaran(tanggal, jumlah, sub_kategori, keterangan, "Baru" if sub_kategori == "Urea X" else "Pupuk")
+        sim.simpan_transaksi(data, "pengeluaran.csv", jurnal, "u").result()
+    data, jurnal = pemasukan("2024-01-02 00:00:00", 1)
+    sim.simpan_transaksi(data, "pemasukan.csv", jurnal, "u").result()
+    for f in FILE_TRANSAKSI:
+        sim.load_data(f, "u")
+    assert muat == [], "tulisan biasa seharusnya disisipkan ke cache tanpa membaca ulang"
+    cek_sama_dengan_muat_ulang(storage, "u")
+
+    # Jumlah pecahan: kolom int64 di cache harus ikut menjadi float64
+    for f in FILE_TRANSAKSI:
+        sim.load_data(f, "u")
+    data, jurnal = pengeluaran("2024-01-15 08:00:00", 1_500.5)
+    sim.simpan_transaksi(data, "pengeluaran.csv", jurnal, "u").result()
+    dari_cache = cek_sama_dengan_muat_ulang(storage, "u")
+    assert dari_cache["pengeluaran.csv"]["Jumlah"].dtype == "float64"
+
+    # Tombstone, lalu tulisan mundur sesudahnya
+    id_hapus = dari_cache["pengeluaran.csv"]["ID"].iloc[5]
+    assert sim.hapus_transaksi_id(id_hapus, "pengeluaran.csv", "u")
+    for f in FILE_TRANSAKSI:
+        sim.load_data(f, "u")
+    data, jurnal = pengeluaran("2024-01-01 00:00:00", 7_000)
+    sim.simpan_transaksi(data, "pengeluaran.csv", jurnal, "u").result()
+    dari_cache = cek_sama_dengan_muat_ulang(storage, "u")
+    assert id_hapus not in set(dari_cache["pengeluaran.csv"]["ID"])
+    assert id_hapus not in set(dari_cache["jurnal.csv"]["ID"])
+
+    # Pasangan debit-kredit tetap berdampingan setelah disisipkan
+    jurnal = dari_cache["jurnal.csv"]
+    assert (jurnal["ID"].iloc[0::2].to_numpy() == jurnal["ID"].iloc[1::2].to_numpy()).all()
+
+# ---------------- Snapshot Neraca ----------------
+
+def cek_neraca(username, tanggal):
+    tanggal = pd.Timestamp(tanggal)
+    dari_snapshot = sim.saldo_kumulatif(username, tanggal)
+    hitung_ulang = sim.hitung_saldo_akun(sim.load_data("jurnal.csv", username, None, tanggal))
+    hitung_ulang = hitung_ulang[(hitung_ulang["Debit"] != 0) | (hitung_ulang["Kredit"] != 0)]
+    assert_frame_equal(
+        dari_snapshot.rename(index=str).sort_index(), hitung_ulang.rename(index=str).sort_index(),
+        check_dtype=False, check_index_type=False, check_like=True, obj=str(tanggal.date()),
+    )
+    a = sim.ringkas_keuangan(dari_snapshot)
+    b = sim.ringkas_keuangan(hitung_ulang)
+    for kunci in ("total_aktiva", "total_kewajiban", "ekuitas", "pendapatan"):
+        assert a[kunci] == pytest.approx(b[kunci]), (tanggal, kunci)
+
+def test_neraca_snapshot_sama_dengan_hitung_ulang(storage, tmp_path):
+    sim.set_storage(None)
+    bench.buat_data(str(tmp_path), ["u"], 3_000, date(2023, 1, 1), date(2024, 6, 30), seed=2)
+    sim.set_storage(storage)
+    titik = ["2023-01-10", "2023-07-31", "2024-03-15", "2024-06-30", "2025-01-01"]
+    for tanggal in titik:
+        cek_neraca("u", tanggal)
+    assert not sim.load_saldo_penutupan("u").empty
+
+    # Tulisan mundur membuka kembali bulan yang sudah ditutup
+    for tanggal, jumlah in [("2023-05-10 00:00:00", 777), ("2023-02-01 00:00:00", 1_250.5)]:
+        data, jurnal = pemasukan(tanggal, jumlah)
+        sim.simpan_transaksi(data, "pemasukan.csv", jurnal, "u").result()
+        assert (sim.load_saldo_penutupan("u")["Bulan"] < tanggal[:7]).all()
+        for t in titik:
+            cek_neraca("u", t)
+
+    # Hapus transaksi lama, lalu kompaksi
+    peng = sim.load_data("pengeluaran.csv", "u")
+    for i in (100, 2_000 % len(peng)):
+        baris = peng.iloc[i]
+        assert sim.hapus_transaksi_id(baris["ID"], "pengeluaran.csv", "u")
+        assert (sim.load_saldo_penutupan("u")["Bulan"] < baris["Tanggal"].strftime("%Y-%m")).all()
+        for t in titik:
+            cek_neraca("u", t)
+    sim.kompaksi_hapus("u")
+    for t in titik:
+        cek_neraca("u", t)
+
+# ---------------- Data lama (sebelum ada ID) ----------------
+
+KOLOM_LAMA = {
+    "pemasukan.csv": ["Tanggal", "Sumber", "Jumlah", "Metode", "Keterangan", "Username"],
+    "jurnal.csv": ["Tanggal", "Akun", "Debit", "Kredit", "Keterangan"],
+}
+
+@pytest.fixture
+def folder_csv(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("KEUANGAN_STORAGE", "csv")
+    sim.set_storage(sim.CsvStorage("."))
+    yield tmp_path
+    sim.flush_tulisan()
+    sim.set_storage(None)
+
+def tulis_file_lama(username, pemasukan_lama, jurnal_lama):
+    # Format file sebelum seri ini: tanpa kolom ID, jurnal ditulis per baris setelah transaksinya
+    for base_filename, rows in (("pemasukan.csv", pemasukan_lama), ("jurnal.csv", jurnal_lama)):
+        pd.DataFrame(rows, columns=KOLOM_LAMA[base_filename]).to_csv(sim.get_user_file(base_filename, username), index=False)
+
+def pemasukan_lama(tanggal, jumlah):
+    return [tanggal, "Penjualan Padi", jumlah, "Tunai", "", "u"]
+
+def jurnal_lama(tanggal, jumlah):
+    return [[tanggal, "Kas", jumlah, 0, "Penjualan Padi"], [tanggal, "Pendapatan", 0, jumlah, "Penjualan Padi"]]
+
+def test_halaman_hapus_dari_file_lama(folder_csv):
+    from streamlit.testing.v1 import AppTest
+
+    tulis_file_lama(
+        "u",
+        [pemasukan_lama("2024-01-05 00:00:00", 100), pemasukan_lama("2024-01-06 00:00:00", 200)],
+        jurnal_lama("2024-01-05 00:00:00", 100) + jurnal_lama("2024-01-06 00:00:00", 200),
+    )
+    sim.register_user("u", "rahasia")
+    at = AppTest.from_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), "sim.py"), default_timeout=60)
+    at.session_state["logged_in"] = True
+    at.session_state["username"] = "u"
+    at.run()
+    at.sidebar.radio[0].set_value("Hapus Transaksi").run()
+    assert not at.exception, [e.value for e in at.exception]
+    assert not at.error, [e.value for e in at.error]
+
+    pem = sim.load_data("pemasukan.csv", "u")
+    jurnal = sim.load_data("jurnal.csv", "u")
+    assert pem["ID"].notna().all()
+    assert sorted(jurnal["ID"].value_counts()) == [2, 2]
+    assert set(jurnal["ID"]) == set(pem["ID"])
+
+def test_lengkapi_id_transaksi_tanpa_jurnal(folder_csv):
+    # Transaksi pertama tidak punya pasangan jurnal (aplikasi berhenti di antara
+    # dua penulisan); transaksi sesudahnya tetap harus terhubung
+    tulis_file_lama(
+        "u",
+        [pemasukan_lama("2024-01-05 00:00:00", 100), pemasukan_lama("2024-01-06 00:00:00", 200),
+         pemasukan_lama("2024-01-07 00:00:00", 300)],
+        jurnal_lama("2024-01-06 00:00:00", 200) + jurnal_lama("2024-01-07 00:00:00", 300),
+    )
+    assert sim.lengkapi_id("u") == 6
+    assert sim.lengkapi_id("u") == 0
+
+    pem = sim.load_data("pemasukan.csv", "u").set_index("Jumlah")
+    jurnal = sim.load_data("jurnal.csv", "u")
+    assert pem["ID"].notna().all() and pem["ID"].is_unique
+    assert not (jurnal["ID"] == pem.at[100, "ID"]).any()
+    for jumlah in (200, 300):
+        pasangan = jurnal[jurnal["ID"] == pem.at[jumlah, "ID"]]
+        assert list(pasangan["Akun"].astype(str)) == ["Kas", "Pendapatan"]
+        assert list(pasangan["Debit"]) == [jumlah, 0]
+
+    # Menghapus transaksi juga membuang pasangan jurnalnya, jadi Laba Rugi tetap
+    # sama dengan daftar transaksi
+    assert sim.hapus_transaksi_id(pem.at[200, "ID"], "pemasukan.csv", "u")
+    jurnal = sim.load_data("jurnal.csv", "u")
+    assert jurnal.loc[jurnal["Akun"] == "Pendapatan", "Kredit"].sum() == 300
+    assert sim.load_data("pemasukan.csv", "u")["Jumlah"].sum() == 400
+
+def test_hapus_bersamaan_hanya_sekali(storage):
+    import threading
+
+    for hari in range(1, 21):
+        data, jurnal = pemasukan(f"2024-03-{hari:02d} 00:00:00", 1_000 * hari)
+        sim.simpan_transaksi(data, "pemasukan.csv", jurnal, "u").result()
+    id_hapus = sim.load_data("pemasukan.csv", "u")["ID"].iloc[4]
+
+    mulai = threading.Barrier(2)
+    hasil = []
+    def hapus():
+        mulai.wait()
+        hasil.append(sim.hapus_transaksi_id(id_hapus, "pemasukan.csv", "u"))
+    threads = [threading.Thread(target=hapus) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(hasil) == [False, True]
+    assert (sim.load_data("hapus.csv", "u")["ID"] == id_hapus).sum() == 1
+    ringkasan = sim.load_ringkasan_bulanan("u")
+    dibangun_ulang = sim.rebuild_ringkasan_bulanan("u")
+    assert ringkasan["Jumlah"].sum() == dibangun_ulang["Jumlah"].sum() == 210_000 - 5_000
+    assert ringkasan["Transaksi"].sum() == dibangun_ulang["Transaksi"].sum() == 19